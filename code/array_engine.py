@@ -0,0 +1,239 @@
+import random
+import numpy as np
+from natural_selection import Agent, SPEED_BOOST, SIZE_BOOST, run_simulation
+from mutation import mutation_table, breed
+from stats import RunningStats, GenerationSeries, TraitHistogram, SPEED_BINS, SIZE_BINS
+
+# STRUCTURE-OF-ARRAYS ENGINE ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Same model as natural_selection.Environment, but the population is kept as
+# NumPy columns (x, y, energy, speed, size, satiated) and every tick is computed
+# for the whole population at once.
+#
+# Differences from the object engine, which walks agents one at a time:
+# - all agents pick their target from the food left at the start of the tick;
+#   agents whose target is eaten during the tick by an agent ahead of them in
+#   population order choose again from what they could still see
+# - when several agents reach the same cell in one tick, the food there goes
+#   to them in population order, one piece per agent, even if an agent further
+#   back in the order emptied the cell earlier in the same tick
+# Results are therefore statistically, not bit-for-bit, equivalent.
+
+# upper bound on agents x food distances computed in one batch
+CHUNK = 1 << 22
+
+
+# index of, and distance to, the closest food in live (indexes into food_x / food_y) for
+# the agents in idx (sorted), ties going to the lowest place in live; food is visible to
+# agent i while until[food] > i, and agents that see none get -1 and the largest int64.
+# Both engines look food up here, so they break ties the same way
+def nearest_visible_food(x, y, food_x, food_y, until, idx, live):
+    far = np.iinfo(np.int64).max
+    target = np.full(len(idx), -1, dtype=np.int64)
+    dist = np.full(len(idx), far, dtype=np.int64)
+    if len(idx) == 0:
+        return target, dist
+    live = live[until[live] > idx[0]]
+    if len(live) == 0:
+        return target, dist
+    fx = food_x[live].astype(np.int32)
+    fy = food_y[live].astype(np.int32)
+    visible = until[live]
+    partial = (visible <= idx[-1]).any()
+    chunk = max(1, CHUNK // len(live))
+    for start in range(0, len(idx), chunk):
+        part = idx[start:start + chunk]
+        d = np.abs(x[part, None].astype(np.int32) - fx[None, :]) + np.abs(y[part, None].astype(np.int32) - fy[None, :])
+        if partial:
+            # hide food this agent can no longer see
+            d = d.astype(np.int64)
+            d[visible[None, :] <= part[:, None]] = far
+        best = d.argmin(axis=1)
+        found = d[np.arange(len(part)), best] < far
+        target[start:start + chunk] = np.where(found, live[best], -1)
+        dist[start:start + chunk] = d[np.arange(len(part)), best]
+    return target, dist
+
+
+class ArrayEnvironment(GenerationSeries):
+    def __init__(self, width, height, num_agents, num_food, seed=None, speed_boost=None, size_boost=None):
+        self.width = width
+        self.height = height
+        self.num_food = num_food
+        # seeded from the random module by default, so random.seed() controls both engines
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.rng = np.random.default_rng(seed)
+
+        # per-agent constants are taken from a freshly spawned Agent
+        template = Agent(0, 0, self)
+        self.start_energy = template.energy
+        self.start_speed = template.speed
+        self.start_size = template.size
+        self.movement_cost = template.movement_cost
+        self.food_reward = template.food_reward
+        self.stationary_penalty = template.stationary_penalty
+        self.speed_boost = SPEED_BOOST if speed_boost is None else speed_boost
+        self.size_boost = SIZE_BOOST if size_boost is None else size_boost
+        self.speed_table = mutation_table(self.speed_boost)
+        self.size_table = mutation_table(self.size_boost)
+
+        self.x = self.rng.integers(0, width + 1, num_agents)
+        self.y = self.rng.integers(0, height + 1, num_agents)
+        self.energy = np.full(num_agents, self.start_energy, dtype=np.int64)
+        self.speed = np.full(num_agents, self.start_speed, dtype=np.int64)
+        self.size = np.full(num_agents, self.start_size, dtype=np.float64)
+        self.satiated = np.zeros(num_agents, dtype=bool)
+
+        # food is stored once per distinct cell, with a count for stacked food
+        self.food_x = np.zeros(0, dtype=np.int64)
+        self.food_y = np.zeros(0, dtype=np.int64)
+        self.food_count = np.zeros(0, dtype=np.int64)
+
+        self.agent_counts = [num_agents]
+        self.remaining_food = []
+        self.avg_energy = []
+        self.avg_speed = []
+        self.avg_size = []
+        # histograms of the survivors' traits per generation
+        self.speed_dist = TraitHistogram(SPEED_BINS)
+        self.size_dist = TraitHistogram(SIZE_BINS)
+
+    def __len__(self):
+        return len(self.x)
+
+    def populate_food(self):
+        fx = self.rng.integers(0, self.width + 1, self.num_food)
+        fy = self.rng.integers(0, self.height + 1, self.num_food)
+        keys = fx * (self.height + 1) + fy
+        # keep distinct cells in order of first appearance, so argmin breaks ties like a list scan
+        _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+        order = np.argsort(first)
+        self.food_x = fx[first[order]]
+        self.food_y = fy[first[order]]
+        self.food_count = counts[order]
+
+    # index of, and distance to, the closest food for the agents in idx (sorted)
+    # food is visible to agent i while visible_until[food] > i
+    def nearest_food(self, idx, visible_until):
+        return nearest_visible_food(self.x, self.y, self.food_x, self.food_y, visible_until, idx, np.arange(len(self.food_x)))
+
+    # one pass over the whole population, returns True once every agent is satiated
+    def tick(self):
+        moved = False
+        pending = np.flatnonzero(~self.satiated)
+        # food eaten up during the pass stays visible to the agents that come
+        # before its last eater in population order, as it would be when walking
+        # the population one agent at a time
+        visible_until = np.where(self.food_count > 0, len(self.x), -1)
+        # agents whose target is emptied by someone ahead of them pick a new one
+        # from what they can still see, so each round removes food or ends the pass
+        while len(pending):
+            target, dist = self.nearest_food(pending, visible_until)
+
+            # determine whether the food is worth consuming
+            worth = (target >= 0) & (dist < self.energy[pending] * self.speed[pending])
+            self.satiated[pending[~worth]] = True
+
+            movers = pending[worth]
+            target = target[worth]
+            dist = dist[worth]
+            steps = np.minimum(self.speed[movers], dist)
+
+            # agents that reach their food eat it, one piece per agent in population order
+            fed = np.zeros(len(movers), dtype=bool)
+            arrived = np.flatnonzero(steps == dist)
+            if len(arrived):
+                cells = target[arrived]
+                order = np.argsort(cells, kind='stable')
+                arrived = arrived[order]
+                cells = cells[order]
+                # position of each agent within the queue for its cell
+                starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+                queue = np.arange(len(cells)) - np.repeat(starts, np.diff(np.r_[starts, len(cells)]))
+                won = queue < self.food_count[cells]
+                fed[arrived[won]] = True
+                np.subtract.at(self.food_count, cells[won], 1)
+                # remember who took the last piece of each emptied cell
+                emptied = np.zeros(len(self.food_count), dtype=np.int64) - 1
+                np.maximum.at(emptied, cells[won], movers[arrived[won]])
+                done = (emptied >= 0) & (self.food_count == 0)
+                visible_until[done] = emptied[done]
+
+            stale = ~fed & (visible_until[target] < movers)
+            go = ~stale
+            self.move(movers[go], self.food_x[target[go]], self.food_y[target[go]], steps[go])
+            self.energy[movers[go]] -= steps[go] * self.movement_cost
+            self.energy[movers[fed]] += self.food_reward
+            moved = moved or go.any()
+            pending = movers[stale]
+
+        # agents standing still pay the penalty every pass, as in the object engine
+        self.energy[self.satiated] -= self.stationary_penalty
+        return not moved
+
+    # closed form of Agent.shortest_path_step: the longer axis is walked until both
+    # deltas match, after which the walk alternates starting with x
+    def move(self, idx, pos_x, pos_y, steps):
+        dx = pos_x - self.x[idx]
+        dy = pos_y - self.y[idx]
+        ax = np.abs(dx)
+        ay = np.abs(dy)
+        lead = np.minimum(steps, np.abs(ax - ay))
+        rest = steps - lead
+        move_x = np.where(ax >= ay, lead, 0) + (rest + 1) // 2
+        move_y = np.where(ax >= ay, 0, lead) + rest // 2
+        self.x[idx] += np.sign(dx) * move_x
+        self.y[idx] += np.sign(dy) * move_y
+
+    def kill_the_weak(self):
+        alive = self.energy > 0
+        self.x = self.x[alive]
+        self.y = self.y[alive]
+        self.energy = self.energy[alive]
+        self.speed = self.speed[alive]
+        self.size = self.size[alive]
+        self.satiated = self.satiated[alive]
+        self.energy_stats, self.speed_stats, self.size_stats = RunningStats(), RunningStats(), RunningStats()
+        self.energy_stats.add_array(self.energy)
+        self.speed_stats.add_array(self.speed)
+        self.size_stats.add_array(self.size)
+
+    # the movement phase: passes until every agent is satiated
+    def movement(self):
+        while not self.tick():
+            pass
+
+    # function that simulates one generation
+    def step(self):
+        self.populate_food()
+        self.movement()
+
+        # remove agents with energy < 0
+        self.kill_the_weak()
+
+        # write metrics to lists for examiniation
+        self.remaining_food.append(int(self.food_count.sum()))
+        self.avg_energy.append(self.energy_stats.summary().mean)
+        self.avg_speed.append(self.speed_stats.summary().mean)
+        self.avg_size.append(self.size_stats.summary().mean)
+        self.speed_dist.add(self.speed)
+        self.size_dist.add(self.size)
+
+        self.reproduce()
+        self.agent_counts.append(len(self))
+
+    # every survivor slot is filled by a random parent (with replacement), which
+    # persists unchanged and also spawns one mutated child
+    def reproduce(self):
+        n = len(self)
+        self.speed, self.size = breed(self.rng, self.speed, self.size, n, self.speed_table, self.size_table)
+        self.x = self.rng.integers(0, self.width + 1, 2 * n)
+        self.y = self.rng.integers(0, self.height + 1, 2 * n)
+        self.energy = np.full(2 * n, self.start_energy, dtype=np.int64)
+        self.satiated = np.zeros(2 * n, dtype=bool)
+
+
+# DRIVER ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+def simulate(x, y, iterations, num_agents, num_food, seed=None, speed_boost=None, size_boost=None, verbose=False, stop=None) :
+    env = ArrayEnvironment(x, y, num_agents, num_food, seed, speed_boost, size_boost)
+    return run_simulation(env, iterations, verbose, stop=stop)
@@ -0,0 +1,180 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import natural_selection
+import predator_extension
+
+# BENCHMARKS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Fixed-seed timings of both models over a matrix of map sizes, agent counts and
+# food counts:
+#   step      Environment.step() over a few generations: ticks/s and agent-moves/s
+#             (an agent-move is one move_to_food call)
+#   simulate  end-to-end simulate() wall time
+#   import    time to import the module in a fresh interpreter, which every sweep
+#             worker pays; it should stay under IMPORT_TARGET and must not pull in
+#             matplotlib or pandas
+# Every case is run `repeat` times and the fastest run is kept.
+#
+#   python benchmark.py run --out baseline.json
+#   ... change something ...
+#   python benchmark.py run --out current.json
+#   python benchmark.py compare baseline.json current.json
+#   python benchmark.py scaling --cores 1 2 4 8
+#
+# compare exits with status 1 when a case got slower than the baseline by more
+# than --threshold (a fraction, 0.10 by default).
+#
+# scaling runs tiled_engine.scaling on a large map: movement-phase seconds, speedup and
+# parallel efficiency of the tiled engine for every worker count in --cores.
+
+MODULES = {'natural_selection': natural_selection, 'predator_extension': predator_extension}
+
+# (width, height), agents, food
+MATRIX = {
+    'quick': ([(100, 100)], [200], [400]),
+    'full': ([(50, 50), (200, 200)], [50, 500], [100, 1000]),
+}
+
+STEP_GENERATIONS = 5
+SIMULATE_GENERATIONS = 10
+SEED = 2023
+
+# seconds; NumPy alone takes about 0.1s to import
+IMPORT_TARGET = 0.3
+HEAVY_MODULES = ('matplotlib', 'pandas')
+
+# metric -> True when bigger is better
+METRICS = {'ticks_per_s': True, 'moves_per_s': True, 'seconds': False}
+
+
+def case_name(module, kind, size, agents, food):
+    return '%s/%s/%dx%d/a%d/f%d' % (module, kind, size[0], size[1], agents, food)
+
+
+def bench_step(module, size, agents, food):
+    random.seed(SEED)
+    env = module.Environment(size[0], size[1], agents, food)
+    start = time.perf_counter()
+    for _ in range(STEP_GENERATIONS):
+        env.step()
+    seconds = time.perf_counter() - start
+    moves = env.counters['nearest_queries'] + env.counters['cached_targets']
+    return {'seconds': seconds, 'ticks_per_s': env.counters['ticks'] / seconds, 'moves_per_s': moves / seconds}
+
+
+def bench_simulate(module, size, agents, food):
+    random.seed(SEED)
+    start = time.perf_counter()
+    module.simulate(size[0], size[1], SIMULATE_GENERATIONS, agents, food)
+    return {'seconds': time.perf_counter() - start}
+
+
+def bench_import(name):
+    code = 'import sys, time; t = time.perf_counter(); import %s; print(time.perf_counter() - t, *(m in sys.modules for m in %r))' % (name, HEAVY_MODULES)
+    out = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout.split()
+    heavy = [m for m, loaded in zip(HEAVY_MODULES, out[1:]) if loaded == 'True']
+    if heavy:
+        print('WARNING %s imports %s' % (name, ', '.join(heavy)))
+    return {'seconds': float(out[0])}
+
+
+# fastest of `repeat` runs, metric by metric
+def best_of(repeat, bench, *args):
+    runs = [bench(*args) for _ in range(repeat)]
+    return {metric: (max if METRICS[metric] else min)(run[metric] for run in runs) for metric in runs[0]}
+
+
+def run(matrix='quick', repeat=3, modules=MODULES, out=None):
+    sizes, agent_counts, food_counts = MATRIX[matrix]
+    results = {}
+    for name in modules:
+        key = '%s/import' % name
+        results[key] = best_of(repeat, bench_import, name)
+        verdict = 'over' if results[key]['seconds'] > IMPORT_TARGET else 'within'
+        print(key, 'seconds=%.4g (%s the %.2gs target)' % (results[key]['seconds'], verdict, IMPORT_TARGET))
+    for (name, module), size, agents, food in itertools.product(modules.items(), sizes, agent_counts, food_counts):
+        for kind, bench in (('step', bench_step), ('simulate', bench_simulate)):
+            key = case_name(name, kind, size, agents, food)
+            results[key] = best_of(repeat, bench, module, size, agents, food)
+            print(key, ' '.join('%s=%.4g' % item for item in sorted(results[key].items())))
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'matrix': matrix,
+        'repeat': repeat,
+        'seed': SEED,
+        'results': results,
+    }
+    if out:
+        with open(out, 'w') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+    return report
+
+
+# (case, metric, baseline, current, relative change) for every metric that got worse
+# by more than threshold; cases missing from either side are skipped
+def regressions(baseline, current, threshold=0.10):
+    found = []
+    for key, metrics in sorted(current['results'].items()):
+        if key not in baseline['results']:
+            continue
+        for metric, value in sorted(metrics.items()):
+            old = baseline['results'][key].get(metric)
+            if not old:
+                continue
+            change = (value - old) / old
+            worse = -change if METRICS[metric] else change
+            if worse > threshold:
+                found.append((key, metric, old, value, change))
+    return found
+
+
+def compare(baseline_path, current_path, threshold=0.10):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(current_path) as f:
+        current = json.load(f)
+    found = regressions(baseline, current, threshold)
+    for key, metric, old, value, change in found:
+        print('REGRESSION %s %s: %.4g -> %.4g (%+.1f%%)' % (key, metric, old, value, 100 * change))
+    if not found:
+        print('no regressions beyond %.0f%%' % (100 * threshold))
+    return found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for natural_selection and predator_extension')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--matrix', choices=sorted(MATRIX), default='quick')
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--module', choices=sorted(MODULES), action='append', help='only benchmark this module (repeatable)')
+    run_parser.add_argument('--out', help='write the results to this JSON file')
+    compare_parser = commands.add_parser('compare', help='flag regressions against a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10)
+    scaling_parser = commands.add_parser('scaling', help='parallel efficiency of the tiled engine')
+    scaling_parser.add_argument('--cores', type=int, nargs='+', default=[1, 2, 4])
+    scaling_parser.add_argument('--size', type=int, default=2000, help='width and height of the map')
+    scaling_parser.add_argument('--agents', type=int, default=20000)
+    scaling_parser.add_argument('--food', type=int, default=40000)
+    scaling_parser.add_argument('--tiles', type=int, default=4, help='tiles per side')
+    scaling_parser.add_argument('--generations', type=int, default=2)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        modules = {name: MODULES[name] for name in args.module} if args.module else MODULES
+        run(args.matrix, args.repeat, modules, args.out)
+    elif args.command == 'scaling':
+        from tiled_engine import scaling
+        scaling(args.size, args.size, args.agents, args.food, args.generations, args.cores, (args.tiles, args.tiles), SEED)
+    else:
+        sys.exit(1 if compare(args.baseline, args.current, args.threshold) else 0)
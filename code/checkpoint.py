@@ -0,0 +1,90 @@
+import json
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# CHECKPOINTS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# An Environment between two generations saved as a .npz of flat columns:
+# one array per agent attribute, one per metric history, and a 'meta' string
+# holding the JSON settings and both random generator states (the random
+# module and the Environment's NumPy generator). Loading it and stepping on
+# gives the same run as never stopping.
+#
+# Environment.state() / Environment.from_state() turn an Environment into
+# such a dict of arrays and back, the functions here do the file side.
+
+
+# state of the random module as (uint32 array, gauss_next)
+def get_random_state():
+    version, internal, gauss_next = random.getstate()
+    return np.array(internal, dtype=np.uint32), gauss_next
+
+
+def set_random_state(internal, gauss_next):
+    random.setstate((3, tuple(int(v) for v in internal), gauss_next))
+
+
+# agents as columns: uid, x, y, energy, speed, size
+# (NumPy picks int64 or float64 per column, so values come back with their type)
+def agent_columns(agents, prefix):
+    columns = {}
+    for name in ('uid', 'x', 'y', 'energy', 'speed', 'size'):
+        columns[prefix + '_' + name] = np.array([getattr(a, name) for a in agents])
+    return columns
+
+
+# respawns the agents saved by agent_columns in env as species (a name, the first
+# species when None), keeping their uids
+def spawn_columns(env, state, prefix, species=None):
+    agents = []
+    columns = [state[prefix + '_' + name].tolist() for name in ('uid', 'x', 'y', 'energy', 'speed', 'size')]
+    for uid, x, y, energy, speed, size in zip(*columns):
+        agent = env.spawn(x, y, species)
+        agent.uid = uid
+        agent.energy = energy
+        agent.speed = speed
+        agent.size = size
+        agents.append(agent)
+    return agents
+
+
+# writes state to path atomically: a crash mid-write leaves the previous checkpoint, and
+# processes writing the same path at once each use their own temporary file
+def write_checkpoint(path, state):
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        np.savez(f, **state)
+    os.replace(tmp, path)
+
+
+def read_checkpoint(path):
+    with np.load(path, allow_pickle=False) as data:
+        state = {name: data[name] for name in data.files}
+    state['meta'] = json.loads(str(state['meta']))
+    return state
+
+
+# saves env every `every` generations; the state is copied out on the calling thread
+# and written on a background thread, at most one write is in flight
+class Checkpointer:
+    def __init__(self, path, every=10):
+        self.path = path
+        self.every = every
+        self.writer = ThreadPoolExecutor(1)
+        self.pending = None
+
+    def after_generation(self, env):
+        if env.generation % self.every == 0:
+            self.save(env)
+
+    def save(self, env):
+        state = env.state()
+        if self.pending is not None:
+            self.pending.result()
+        self.pending = self.writer.submit(write_checkpoint, self.path, state)
+
+    def close(self):
+        if self.pending is not None:
+            self.pending.result()
+        self.writer.shutdown()
@@ -19,7 +19,7 @@ num_food = 100
 # SIZE = 10
 
 # run simulation
-population, food, avg_speed, avg_size, speed_dist, size_dist = simulate(env_x, env_y, generation, num_agents, num_food)
+population, food, avg_speed, avg_size, speed_dist, size_dist = simulate(env_x, env_y, generation, num_agents, num_food, verbose=True)
 
 # plot
 fig, axs = plt.subplots(5, figsize=(8, 8), constrained_layout=True)
@@ -36,24 +36,27 @@ axs[2].set(ylabel="Average Agent Size", xlabel="Generations")
 axs[2].xaxis.set_ticks(range(0, generation+1))
 # histogram for population and speed distribution
 
-cnts, values, bars = axs[3].hist(speed_dist[-1], bins=range(0,int(max(speed_dist[-1]))*2), edgecolor='k', align='left')
-if len(cnts) == 0:
-    cnts = 1
+# speed_dist / size_dist are histograms per generation, the last one is drawn as bars
+left, width, cnts = speed_dist.occupied()
+bars = axs[3].bar(left, cnts, width=width, align='edge', edgecolor='k')
+top = max(speed_dist.last, default=0)
 axs[3].set(ylabel="Frequency", xlabel="Speed")
-axs[3].set_xlim(0, max(speed_dist[-1])+1)
-axs[3].set_ylim(0, max(cnts)+1)
-axs[3].xaxis.set_ticks(range(0, int(max(speed_dist[-1]))+2))
+axs[3].set_xlim(0, top+1)
+axs[3].set_ylim(0, max(cnts, default=0)+1)
+axs[3].xaxis.set_ticks(range(0, int(top)+2))
 cmap = plt.cm.viridis
-for i, (cnt, value, bar) in enumerate(zip(cnts, values, bars)):
+for cnt, bar in zip(cnts, bars):
     bar.set_facecolor(cmap(cnt/cnts.max()))
 
-cnts, values, bars = axs[4].hist(size_dist[-1], bins=range(0,int(max(size_dist[-1]))*2), edgecolor='k', align='left')
+left, width, cnts = size_dist.occupied()
+bars = axs[4].bar(left, cnts, width=width, align='edge', edgecolor='k')
+top = max(size_dist.last, default=0)
 axs[4].set(ylabel="Frequency", xlabel="Size")
-axs[4].set_xlim(0, max(size_dist[-1])+1)
-axs[4].set_ylim(0, max(cnts)+1)
-axs[4].xaxis.set_ticks(range(0, int(max(size_dist[-1]))+2))
+axs[4].set_xlim(0, top+1)
+axs[4].set_ylim(0, max(cnts, default=0)+1)
+axs[4].xaxis.set_ticks(range(0, int(top)+2))
 cmap = plt.cm.plasma
-for i, (cnt, value, bar) in enumerate(zip(cnts, values, bars)):
+for cnt, bar in zip(cnts, bars):
     bar.set_facecolor(cmap(cnt/cnts.max()))
  
 plt.show()
\ No newline at end of file
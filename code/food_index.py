@@ -0,0 +1,127 @@
+import math
+
+# FOOD INDEXES ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Nearest-food lookup structures owned by the Environment.
+# Every index answers nearest(x, y) with exactly the target the original linear
+# scan over food_grid would pick: smallest manhattan distance, with ties going
+# to the food that comes first in food_grid. remove(pos) mirrors
+# food_grid.remove(pos), i.e. it drops the first remaining copy of pos.
+# Indexes add the number of distances they compute to counters['distance_evals'].
+
+# reference implementation, scans every piece of food
+class LinearFoodIndex:
+    def __init__(self, food, width, height, counters=None):
+        self.food = list(food)
+        self.counters = {'distance_evals': 0} if counters is None else counters
+
+    def __len__(self):
+        return len(self.food)
+
+    def nearest(self, x, y):
+        self.counters['distance_evals'] += len(self.food)
+        closest = None
+        dist = float('inf')
+        for food in self.food:
+            distance_to_food = abs(x - food[0]) + abs(y - food[1])
+            if distance_to_food < dist:
+                closest = food
+                dist = distance_to_food
+        return closest, dist
+
+    def remove(self, pos):
+        self.food.remove(pos)
+
+
+# uniform grid of buckets, searched ring by ring outwards from the agent's cell
+class GridFoodIndex:
+    def __init__(self, food, width, height, counters=None, per_cell=2):
+        self.counters = {'distance_evals': 0} if counters is None else counters
+        self.area = (width + 1) * (height + 1)
+        self.per_cell = per_cell
+        # rank = position in food_grid, used to break distance ties like the linear scan
+        self._build([(rank, food_x, food_y) for rank, (food_x, food_y) in enumerate(food)])
+
+    def _build(self, entries):
+        self.size = len(entries)
+        self.buckets = {}
+        # cell size chosen so that a bucket holds about per_cell items on average
+        self.cell = max(1, math.ceil(math.sqrt(self.per_cell * self.area / max(self.size, 1))))
+        # coarsen the grid once most of the food is gone so searches don't crawl through empty cells
+        self.rebuild_at = self.size // 4
+        for entry in entries:
+            key = (entry[1] // self.cell, entry[2] // self.cell)
+            self.buckets.setdefault(key, []).append(entry)
+        if self.buckets:
+            self.min_cx = min(k[0] for k in self.buckets)
+            self.max_cx = max(k[0] for k in self.buckets)
+            self.min_cy = min(k[1] for k in self.buckets)
+            self.max_cy = max(k[1] for k in self.buckets)
+
+    def __len__(self):
+        return self.size
+
+    def nearest(self, x, y):
+        if self.size == 0:
+            return None, float('inf')
+        cell = self.cell
+        cx = x // cell
+        cy = y // cell
+        # furthest ring that can still contain a bucket
+        max_ring = max(cx - self.min_cx, self.max_cx - cx, cy - self.min_cy, self.max_cy - cy)
+        best = None
+        best_dist = float('inf')
+        best_rank = -1
+        evaluations = 0
+        ring = 0
+        while ring <= max_ring:
+            for key in self._ring(cx, cy, ring):
+                bucket = self.buckets.get(key)
+                if not bucket:
+                    continue
+                evaluations += len(bucket)
+                for rank, food_x, food_y in bucket:
+                    distance_to_food = abs(x - food_x) + abs(y - food_y)
+                    if distance_to_food < best_dist or (distance_to_food == best_dist and rank < best_rank):
+                        best = (food_x, food_y)
+                        best_dist = distance_to_food
+                        best_rank = rank
+            # every cell of the next ring is at least ring * cell + 1 away
+            if best_dist <= ring * cell:
+                break
+            ring += 1
+        self.counters['distance_evals'] += evaluations
+        return best, best_dist
+
+    # cell keys at chebyshev distance ring from (cx, cy)
+    def _ring(self, cx, cy, ring):
+        if ring == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-ring, ring + 1):
+            yield (cx + dx, cy - ring)
+            yield (cx + dx, cy + ring)
+        for dy in range(-ring + 1, ring):
+            yield (cx - ring, cy + dy)
+            yield (cx + ring, cy + dy)
+
+    def remove(self, pos):
+        key = (pos[0] // self.cell, pos[1] // self.cell)
+        bucket = self.buckets[key]
+        # buckets are kept in rank order, so the first match is the first copy in food_grid
+        for i, (rank, food_x, food_y) in enumerate(bucket):
+            if (food_x, food_y) == pos:
+                del bucket[i]
+                break
+        else:
+            raise ValueError('food not in index')
+        if not bucket:
+            del self.buckets[key]
+        self.size -= 1
+        if self.size < self.rebuild_at:
+            self._build(sorted(entry for bucket in self.buckets.values() for entry in bucket))
+
+
+FOOD_INDEXES = {
+    'linear': LinearFoodIndex,
+    'grid': GridFoodIndex,
+}
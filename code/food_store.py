@@ -0,0 +1,58 @@
+from collections import deque
+
+# FOOD STORE ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Food for one generation, keyed by cell. Pieces stacked on the same cell are
+# counted instead of stored as separate list entries, so lookup and removal by
+# coordinate are constant time.
+# Each piece keeps its rank (the order populate_food drew it in), and removal
+# always takes the lowest-ranked piece of a cell, the same piece list.remove()
+# took from the old food_grid list.
+# version counts removals, and touched[pos] is the version of the last removal at
+# pos, so anything looked up at version v is still current while touched[pos] <= v.
+class FoodStore:
+    def __init__(self, food=()):
+        self.cells = {}
+        self.total = 0
+        self.version = 0
+        self.touched = {}
+        for rank, pos in enumerate(food):
+            self.cells.setdefault(pos, deque()).append(rank)
+            self.total += 1
+
+    def __len__(self):
+        return self.total
+
+    def __contains__(self, pos):
+        return pos in self.cells
+
+    # every piece of food, stacked pieces repeated
+    def __iter__(self):
+        for pos, ranks in self.cells.items():
+            for _ in range(len(ranks)):
+                yield pos
+
+    def __repr__(self):
+        return 'FoodStore(' + repr(list(self)) + ')'
+
+    def count(self, pos):
+        ranks = self.cells.get(pos)
+        return len(ranks) if ranks else 0
+
+    # distinct cells holding food, cheap to hand to a scatter plot
+    def positions(self):
+        return list(self.cells)
+
+    # remove one piece from pos and return its rank
+    def remove(self, pos):
+        ranks = self.cells[pos]
+        rank = ranks.popleft()
+        if not ranks:
+            del self.cells[pos]
+        self.total -= 1
+        self.version += 1
+        self.touched[pos] = self.version
+        return rank
+
+    # True while no food at pos has been removed since version
+    def unchanged(self, pos, version):
+        return self.touched.get(pos, 0) <= version
@@ -0,0 +1,91 @@
+import numpy as np
+
+# GENOTYPE POOL ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# A population stored as {(speed, size): count} instead of one Agent per
+# individual. Reproduction works on the counts directly: drawing parents with
+# replacement is a multinomial split of the population over its genotypes, and
+# the children of each genotype are split multinomially over the mutation
+# outcomes. That is the same distribution as the per-agent loop in
+# Environment.step, at a cost that depends on the number of distinct genotypes
+# rather than the number of agents.
+class GenotypePool:
+    def __init__(self, counts=None):
+        self.counts = dict(counts) if counts else {}
+
+    @classmethod
+    def from_agents(cls, agents):
+        pool = cls()
+        for agent in agents:
+            key = (agent.speed, agent.size)
+            pool.counts[key] = pool.counts.get(key, 0) + 1
+        return pool
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    # every survivor slot is filled by a random parent, which persists unchanged
+    # and spawns one mutated child
+    def reproduce(self, rng, speed_boost, size_boost):
+        total = len(self)
+        new = GenotypePool()
+        if total == 0:
+            return new
+        genotypes = list(self.counts)
+        weights = np.array([self.counts[g] for g in genotypes], dtype=np.float64)
+        parents = rng.multinomial(total, weights / total)
+
+        speed_steps = list(speed_boost)
+        speed_p = np.array(list(speed_boost.values()), dtype=np.float64)
+        size_factors = list(size_boost)
+        size_p = np.array(list(size_boost.values()), dtype=np.float64)
+        outcome_p = np.outer(speed_p / speed_p.sum(), size_p / size_p.sum()).ravel()
+
+        for (speed, size), n in zip(genotypes, parents):
+            if n == 0:
+                continue
+            new.add(speed, size, int(n))
+            children = rng.multinomial(n, outcome_p)
+            for k in np.flatnonzero(children):
+                child_speed = speed + speed_steps[k // len(size_factors)]
+                child_size = size * size_factors[k % len(size_factors)]
+                # minimums
+                child_speed = max(child_speed, 1)
+                if child_size <= 0.1:
+                    child_size = 0.1
+                new.add(child_speed, child_size, int(children[k]))
+        return new
+
+    def add(self, speed, size, n=1):
+        self.counts[(speed, size)] = self.counts.get((speed, size), 0) + n
+
+    # folds the individuals of other into this pool
+    def update(self, other):
+        for (speed, size), n in other.counts.items():
+            self.add(speed, size, n)
+
+    # speeds, sizes and counts of the genotypes, as lists in the same order
+    def columns(self):
+        return [g[0] for g in self.counts], [g[1] for g in self.counts], list(self.counts.values())
+
+    # spawn individuals in env at random positions, in random order: all of them, or when
+    # limit is smaller than the pool, limit of them drawn at random without replacement;
+    # returns the agents and a GenotypePool of the individuals left out
+    def materialize(self, env, rng, limit=None):
+        speeds, sizes, counts = self.columns()
+        drawn = np.array(counts, dtype=np.int64)
+        if limit is not None and limit < drawn.sum():
+            drawn = rng.multivariate_hypergeometric(drawn, limit)
+        rest = GenotypePool({g: n - k for g, n, k in zip(self.counts, counts, drawn.tolist()) if n > k})
+        total = int(drawn.sum())
+        speeds = np.repeat(speeds, drawn)
+        sizes = np.repeat(sizes, drawn)
+        order = rng.permutation(total)
+        xs = rng.integers(0, env.width + 1, total).tolist()
+        ys = rng.integers(0, env.height + 1, total).tolist()
+        agents = []
+        for k, i in enumerate(order.tolist()):
+            agent = env.spawn(xs[k], ys[k])
+            agent.speed = speeds[i].item()
+            agent.size = sizes[i].item()
+            agents.append(agent)
+        return agents, rest
@@ -0,0 +1,35 @@
+import numpy as np
+
+# REPRODUCTION ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Turnover for a whole generation in a handful of vectorized draws, shared by
+# the object and array engines.
+
+
+# mutation table {change: weight} as (changes, probabilities) arrays
+def mutation_table(table):
+    changes = np.array(list(table.keys()))
+    weights = np.array(list(table.values()), dtype=np.float64)
+    if (weights < 0).any() or weights.sum() <= 0:
+        raise ValueError('mutation weights must be non-negative and not all zero: ' + str(table))
+    return changes, weights / weights.sum()
+
+
+# n parents drawn with replacement from the current speeds / sizes, each kept as
+# is and followed by one mutated child, so the result has 2n entries ordered
+# parent, child, parent, child, ...
+def breed(rng, speeds, sizes, n, speed_table, size_table):
+    speeds = np.asarray(speeds)
+    sizes = np.asarray(sizes, dtype=np.float64)
+    if n == 0 or len(speeds) == 0:
+        return speeds[:0], sizes[:0]
+    parents = rng.integers(0, len(speeds), n)
+    speed_changes, speed_p = speed_table
+    size_changes, size_p = size_table
+    child_speed = speeds[parents] + rng.choice(speed_changes, n, p=speed_p)
+    child_size = sizes[parents] * rng.choice(size_changes, n, p=size_p)
+    # minimums; tables may hold steps below -1, so speeds are clamped, not just bumped off 0
+    np.maximum(child_speed, 1, out=child_speed)
+    child_size[child_size <= 0.1] = 0.1
+    new_speed = np.stack([speeds[parents], child_speed], axis=1).ravel()
+    new_size = np.stack([sizes[parents], child_size], axis=1).ravel()
+    return new_speed, new_size
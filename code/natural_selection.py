@@ -1,9 +1,27 @@
 import random
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
+import json
+import heapq
+import math
 import numpy as np
-import pandas as pd
 import os
+import importlib.util
+from collections import namedtuple
+from food_index import FOOD_INDEXES
+from food_store import FoodStore
+from occupancy import Occupancy
+from genotypes import GenotypePool
+from mutation import mutation_table, breed
+from checkpoint import get_random_state, set_random_state, agent_columns, spawn_columns, write_checkpoint, read_checkpoint, Checkpointer
+from stats import RunningStats, GenerationSeries, TraitHistogram, SPEED_BINS, SIZE_BINS
+
+# random mutation occurs with the following odds
+SPEED_BOOST = {-1:1, 0:8, 1:1}
+SIZE_BOOST = {0.85:1, 1:8, 1.15:1}
+
+# a 'genotypes' population spawns at most this many agents per piece of food for the
+# movement phase unless Environment(max_agents=...) says otherwise; runs with food
+# settle at a few agents per piece, so the cap only binds on starved or foodless maps
+MAX_AGENTS_PER_FOOD = 16
 
 # AGENT CLASS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 class Agent:
@@ -11,13 +29,22 @@ class Agent:
         self.x = x
         self.y = y
         self.environment = environment
+        self.uid = None # unique id handed out by Environment.spawn
+        self.species = None # name of the Species it was spawned as
         self.satiated = False
+        self.eaten = False # eaten by a hunter this generation
+        self.steps_taken = 0 # steps moved during the current pass
+        self.path_steps = 0 # steps moved this generation, folded into counters after the movement phase
+        self.target = None # food chosen on the last call to move_to_food
+        self.target_store = None # food store the target was looked up in
+        self.target_version = 0 # and that store's version at the time
         self.energy = 100000 # starting energy when agent is spawned
         self.speed = 5
         self.size = 10
         self.movement_cost = self.speed * (self.size ** 3)# 1/speed to get step cost, * speed^2 as biological limitation, add'l energy for add'l speed
         self.food_reward = 250000 # reward collected for consuming food
         self.stationary_penalty = 50000 # penalty for remaining stationary
+        self.hunt_reward = 0 # reward collected for every agent it eats
 
     def manhattan(self, food):
         return (abs(self.x - food[0]) + abs(self.y - food[1]))
@@ -64,253 +91,734 @@ class Agent:
             y_delta = pos_y - agent_y
             x_delta = pos_x - agent_x
             consumed = y_delta == 0 and x_delta == 0
+        self.steps_taken = self.speed - spaces_to_move
+        self.path_steps += self.steps_taken
+    
+    # closed form of shortest_path_step over `steps` cells towards pos, which must not be overshot
+    # the walk takes the longer axis until both deltas match, then alternates starting with x
+    def advance(self, pos, steps):
+        x_delta = pos[0] - self.x
+        y_delta = pos[1] - self.y
+        lead = min(steps, abs(abs(x_delta) - abs(y_delta)))
+        rest = steps - lead
+        move_x = (rest + 1) // 2
+        move_y = rest // 2
+        if abs(x_delta) >= abs(y_delta):
+            move_x += lead
+        else:
+            move_y += lead
+        self.x += move_x if x_delta > 0 else -move_x
+        self.y += move_y if y_delta > 0 else -move_y
+        self.energy -= steps * self.movement_cost
+        self.path_steps += steps
     
     # Movement to closest food object
     def move_to_food(self):
-        closest = None
-        dist = float('inf')
-
+        environment = self.environment
+        food = environment.food_grid
+        counters = environment.counters
         # get closest food
-        for i in range(len(self.environment.food_grid)):
-            distance_to_food = self.manhattan(self.environment.food_grid[i])
-            if distance_to_food < dist:
-                closest = self.environment.food_grid[i]
-                dist = distance_to_food
+        # walking straight at the closest food brings it one step closer per step and every
+        # other piece at most one step closer, so it stays the closest (ties included) until
+        # food at that cell is eaten
+        if self.target is not None and self.target_store is food and food.unchanged(self.target, self.target_version):
+            closest = self.target
+            dist = self.manhattan(closest)
+            counters['cached_targets'] += 1
+            counters['distance_evals'] += 1
+        else:
+            closest, dist = environment.food_index.nearest(self.x, self.y)
+            self.target_store = food
+            self.target_version = food.version
+            counters['nearest_queries'] += 1
 
         # determine whether the food is worth consuming
         if dist < (self.energy * self.speed):
+            self.target = closest
             self.shortest_path_step(closest)
             self.eat()   
         else:
+            self.target = None
             self.energy -= self.stationary_penalty
             self.satiated = True
 
     def eat(self):
-        if ((self.x, self.y) in self.environment.food_grid):
-            self.environment.food_grid.remove((self.x, self.y))
-            self.energy += self.food_reward
+        pos = (self.x, self.y)
+        if (pos in self.environment.food_grid):
+            if self.environment.contention == 'arrival':
+                # food is handed out once every agent has moved
+                self.environment.claims.setdefault(pos, []).append(self)
+            else:
+                self.environment.consume(pos)
+                self.energy += self.food_reward
+
+    # eats the latest agent of species prey to arrive on this cell, if there is one;
+    # eaten agents are out of energy and stop moving, kill_the_weak removes them; food the
+    # victim claimed this pass ('arrival' contention) is still used up, as with 'sequential'
+    # where it ate before being caught, but no longer feeds it
+    def hunt(self, prey):
+        victim = self.environment.cells[prey].take((self.x, self.y))
+        if victim is not None:
+            victim.eaten = True
+            victim.energy = 0
+            victim.satiated = True
+            self.energy += self.hunt_reward
+
+# SPECIES ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Species are plain data and an Environment runs any number of them through the same
+# tick loop and the same turnover phase. Traits left as None keep the Agent defaults;
+# movement_cost then follows the species' own starting speed and size.
+#   share       starting population as a fraction of num_agents
+#   mobile      False for ambushers that never move or forage, they only eat what comes to them
+#   eats        names of the species it hunts: whenever a hunter and its prey stand on the
+#               same cell after either of them moved, the hunter eats the latest prey to arrive
+#   turnover    fraction of the survivors drawn as parents at the end of a generation
+#   speed_boost / size_boost   mutation tables, SPEED_BOOST / SIZE_BOOST when None
+# The first species is the one agents, agent_counts and the trait metrics describe.
+TRAITS = ('energy', 'speed', 'size', 'movement_cost', 'food_reward', 'stationary_penalty', 'hunt_reward')
+Species = namedtuple('Species', ('name', 'share', 'mobile', 'eats', 'turnover', 'speed_boost', 'size_boost') + TRAITS,
+                     defaults=(1.0, True, (), 1.0, None, None) + (None,) * len(TRAITS))
+
+
+# species as JSON-friendly dicts (mutation tables as [value, weight] pairs) and back
+def species_to_json(species):
+    fields = species._asdict()
+    fields['eats'] = list(species.eats)
+    for name in ('speed_boost', 'size_boost'):
+        if fields[name] is not None:
+            fields[name] = list(fields[name].items())
+    return fields
+
+
+def species_from_json(fields):
+    fields = dict(fields, eats=tuple(fields['eats']))
+    for name in ('speed_boost', 'size_boost'):
+        if fields[name] is not None:
+            fields[name] = dict(fields[name])
+    return Species(**fields)
 
 # ENVIRONMENT CLASS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-class Environment:
-    def __init__(self, width, height, num_agents, num_food):
+class Environment(GenerationSeries):
+    # contention decides who eats when several agents reach the same food in one pass:
+    # 'sequential' feeds whoever moves first in agent order, 'arrival' collects claims
+    # during the pass and feeds the agents that needed the fewest steps (then the lowest uid)
+    # scheduler 'tick' moves every agent on every pass, 'event' only wakes agents up when
+    # they reach their food, give up, or lose their target (see run_events)
+    # penalty 'per_pass' charges satiated agents stationary_penalty on every pass until the
+    # whole generation is satiated, 'once' only charges it on the pass they stop
+    # speed_boost / size_boost replace the SPEED_BOOST / SIZE_BOOST mutation tables
+    # population 'agents' keeps one Agent per individual between generations, 'genotypes'
+    # keeps a GenotypePool of (speed, size) counts and only spawns Agents for the movement phase
+    # max_agents caps how many individuals of a 'genotypes' generation are spawned, a random
+    # draw from the pool (MAX_AGENTS_PER_FOOD * num_food by default), so a generation never
+    # holds more Agents than that however large the pool grows. The rest neither walk nor
+    # eat and are settled from their counts (see settle_crowd): exact without food, an
+    # approximation otherwise, and runs whose population stays within the cap are the
+    # same as without one
+    # seed feeds the NumPy generator used for reproduction, by default it is drawn from the
+    # random module so that random.seed() still fixes the whole run
+    # recorder is a TrajectoryRecorder that keeps agent positions and food layouts,
+    # nothing is recorded without one
+    # profiler is a StepProfiler that times the phases of every step()
+    # species is a sequence of Species, a single one named 'agent' with the Agent defaults
+    # when None; speed_boost / size_boost apply to the first one
+    # backend 'python' moves Agent objects, 'kernel' runs the passes on the array kernel in
+    # tick_kernel.py (compiled with numba when it is installed), and 'auto' picks the kernel
+    # when numba is installed and the settings allow it
+    def __init__(self, width, height, num_agents, num_food, food_index='grid', contention='sequential', scheduler='tick', penalty='per_pass', speed_boost=None, size_boost=None, population='agents', seed=None, recorder=None, profiler=None, species=None, backend='auto', max_agents=None):
         self.width = width
         self.height = height
         self.num_food = num_food
-        self.agents = [Agent(random.randint(0, width), random.randint(0, height), self) for _ in range(num_agents)] # 10 agents to start
-        self.agent_counts = [len(self.agents)]
-        self.food_grid = []
+        self.species = tuple(species) if species else (Species('agent'),)
+        focal = self.species[0]
+        self.focal = focal.name
+        if speed_boost is None:
+            speed_boost = SPEED_BOOST if focal.speed_boost is None else focal.speed_boost
+        if size_boost is None:
+            size_boost = SIZE_BOOST if focal.size_boost is None else focal.size_boost
+        self.speed_boost = speed_boost
+        self.size_boost = size_boost
+        self.setup_species()
+        self.speed_table, self.size_table = self.tables[self.focal]
+        self.rng = np.random.default_rng(random.getrandbits(64) if seed is None else seed)
+        if contention not in ('sequential', 'arrival'):
+            raise ValueError('unknown contention rule: ' + str(contention))
+        if scheduler not in ('tick', 'event'):
+            raise ValueError('unknown scheduler: ' + str(scheduler))
+        if scheduler == 'event' and contention != 'sequential':
+            raise ValueError("the event scheduler only supports 'sequential' contention")
+        if penalty not in ('per_pass', 'once'):
+            raise ValueError('unknown penalty rule: ' + str(penalty))
+        if population not in ('agents', 'genotypes'):
+            raise ValueError('unknown population representation: ' + str(population))
+        if population == 'agents' and max_agents is not None:
+            raise ValueError("max_agents needs population='genotypes'")
+        if len(self.species) > 1 and (scheduler == 'event' or population == 'genotypes'):
+            raise ValueError("several species need scheduler='tick' and population='agents'")
+        if backend not in ('auto', 'python', 'kernel'):
+            raise ValueError('unknown backend: ' + str(backend))
+        # the kernel has no hunting, claims or recorder, and the event scheduler has its own loop
+        kernel_ok = scheduler == 'tick' and contention == 'sequential' and recorder is None and not self.hunting
+        if backend == 'kernel' and not kernel_ok:
+            raise ValueError("the kernel backend needs scheduler='tick', 'sequential' contention, no recorder and no hunting")
+        self.use_kernel = kernel_ok and (backend == 'kernel' or (backend == 'auto' and importlib.util.find_spec('numba') is not None))
+        self.contention = contention
+        self.scheduler = scheduler
+        self.penalty = penalty
+        self.population = population
+        self.pool = None # next generation, while population == 'genotypes'
+        if population == 'genotypes' and max_agents is None:
+            max_agents = MAX_AGENTS_PER_FOOD * num_food
+        self.max_agents = max_agents
+        self.crowd = GenotypePool() # individuals of this generation that were not spawned
+        self.crowd_energy = 0 # and the energy each of them ends the movement phase with
+        self.claims = {}
+        self.next_uid = 0
+        # running totals of nearest-food work: full index lookups, cached targets reused,
+        # and manhattan distances computed by either, plus the passes (ticks) simulated and
+        # the cells walked
+        self.counters = {'nearest_queries': 0, 'cached_targets': 0, 'distance_evals': 0, 'ticks': 0, 'path_steps': 0}
+        # nearest-food lookup structure, rebuilt every time food is populated
+        self.food_index_type = FOOD_INDEXES[food_index]
+        self.food_index = self.food_index_type([], width, height, self.counters)
+        self.populations = {}
+        self.counts = {}
+        for species in self.species:
+            self.populations[species.name] = [self.spawn(random.randint(0, width), random.randint(0, height), species.name) for _ in range(int(num_agents * species.share))]
+            self.counts[species.name] = [len(self.populations[species.name])]
+        # who stands where during a generation, for the species that hunt or are hunted
+        self.cells = {}
+        self.food_grid = FoodStore()
         self.remaining_food = []
         self.avg_energy = []
         self.avg_speed = []
         self.avg_size = []
-        self.positions = [[] for _ in range(num_agents)]
-        self.food_positions = []
-        self.speed_dist = []
-        self.size_dist = []
+        self.generation = 0
+        self.energy_stats, self.speed_stats, self.size_stats = RunningStats(), RunningStats(), RunningStats()
+        self.recorder = recorder
+        self.profiler = profiler
+        if recorder is not None:
+            recorder.bind(width, height)
+        # histograms of the survivors' traits per generation
+        self.speed_dist = TraitHistogram(SPEED_BINS)
+        self.size_dist = TraitHistogram(SIZE_BINS)
         
+    # checks the declarations and works out what spawn, the tick loop and reproduce need:
+    # the trait overrides, the mutation tables, and who eats whom
+    def setup_species(self):
+        names = [species.name for species in self.species]
+        if len(set(names)) != len(names):
+            raise ValueError('species names must be unique: ' + str(names))
+        template = Agent(0, 0, self)
+        self.traits = {}
+        self.tables = {}
+        self.diet = {}
+        self.hunters = {}
+        for species in self.species:
+            traits = {name: getattr(species, name) for name in TRAITS if getattr(species, name) is not None}
+            if 'movement_cost' not in traits and ('speed' in traits or 'size' in traits):
+                traits['movement_cost'] = traits.get('speed', template.speed) * traits.get('size', template.size) ** 3
+            self.traits[species.name] = traits
+            if species is self.species[0]:
+                speed_boost, size_boost = self.speed_boost, self.size_boost
+            else:
+                speed_boost = SPEED_BOOST if species.speed_boost is None else species.speed_boost
+                size_boost = SIZE_BOOST if species.size_boost is None else species.size_boost
+            self.tables[species.name] = (mutation_table(speed_boost), mutation_table(size_boost))
+            for prey in species.eats:
+                if prey not in names or prey == species.name:
+                    raise ValueError('%s cannot eat %s' % (species.name, prey))
+            self.diet[species.name] = tuple(species.eats)
+            self.hunters[species.name] = tuple(hunter.name for hunter in self.species if species.name in hunter.eats)
+        self.hunting = [name for name in names if self.diet[name] or self.hunters[name]]
+
+    # the first species, the one the metrics follow
+    @property
+    def agents(self):
+        return self.populations[self.focal]
+
+    @agents.setter
+    def agents(self, agents):
+        self.populations[self.focal] = agents
+
+    @property
+    def agent_counts(self):
+        return self.counts[self.focal]
+
+    @agent_counts.setter
+    def agent_counts(self, counts):
+        self.counts[self.focal] = counts
+
+    # the agents that take part in the passes, in the order they move
+    def movers(self):
+        return [agent for species in self.species if species.mobile for agent in self.populations[species.name]]
+
+    def spawn(self, x, y, species=None):
+        agent = Agent(x, y, self)
+        agent.species = species or self.focal
+        traits = self.traits[agent.species]
+        if traits:
+            agent.__dict__.update(traits)
+        agent.uid = self.next_uid
+        self.next_uid += 1
+        return agent
+
     def populate_food(self):
-        self.food_grid = [(random.randint(0, self.width), random.randint(0, self.height)) for _ in range(self.num_food)]
-        self.food_positions.append(self.food_grid)
-        return self.food_positions
+        food = [(random.randint(0, self.width), random.randint(0, self.height)) for _ in range(self.num_food)]
+        self.food_grid = FoodStore(food)
+        self.food_index = self.food_index_type(food, self.width, self.height, self.counters)
+        if self.recorder is not None:
+            self.recorder.begin_generation(self.generation)
+            self.recorder.record_food(food)
+
+    # remove one piece of food at pos from the store and the index
+    def consume(self, pos):
+        self.food_grid.remove(pos)
+        self.food_index.remove(pos)
+
+    # hand out the food claimed during an 'arrival' pass, earliest arrival first
+    def resolve_claims(self):
+        for pos, claimants in self.claims.items():
+            claimants.sort(key=lambda agent: (agent.steps_taken / agent.speed, agent.uid))
+            for agent in claimants[:self.food_grid.count(pos)]:
+                self.consume(pos)
+                if not agent.eaten:
+                    agent.energy += agent.food_reward
+        self.claims = {}
 
+    # drops agents out of energy and summarises the survivors' traits (of the first
+    # species) in the same pass, counting in the crowd of a 'genotypes' generation
     def kill_the_weak(self):
-        self.agents = [agent for agent in self.agents if agent.energy > 0.0]
+        energy, speed, size = RunningStats(), RunningStats(), RunningStats()
+        survivors = []
+        for agent in self.agents:
+            if agent.energy > 0.0:
+                survivors.append(agent)
+                energy.add(agent.energy)
+                speed.add(agent.speed)
+                size.add(agent.size)
+        self.agents = survivors
+        if len(self.crowd):
+            if self.crowd_energy > 0.0:
+                speeds, sizes, counts = self.crowd.columns()
+                energy.add_counts([self.crowd_energy], [len(self.crowd)])
+                speed.add_counts(speeds, counts)
+                size.add_counts(sizes, counts)
+            else:
+                self.crowd = GenotypePool()
+        self.energy_stats, self.speed_stats, self.size_stats = energy, speed, size
+        for species in self.species[1:]:
+            self.populations[species.name] = [agent for agent in self.populations[species.name] if agent.energy > 0.0]
 
-    def calculate_energy_avg(self):
-        energy = [agent.energy for agent in self.agents]
-        avg = sum(energy) / len(energy)
-        return avg
-    
-    def calculate_speed_avg(self):
-        speed = [agent.speed for agent in self.agents]
-        avg = sum(speed) / len(speed)
-        return avg
-    
-    def calculate_size_avg(self):
-        size = [agent.size for agent in self.agents]
-        avg = sum(size) / len(size)
-        return avg
+    # agent has just moved away from old: it is moved in the cell index, every hunter of
+    # its species on the new cell hunts, then the agent hunts there itself
+    def encounter(self, agent, old):
+        cell = (agent.x, agent.y)
+        species = agent.species
+        cells = self.cells
+        if cell != old and species in cells:
+            cells[species].move(agent, old)
+        for hunter_species in self.hunters[species]:
+            hunters = cells[hunter_species].get(cell)
+            if hunters is not None:
+                for hunter in hunters:
+                    hunter.hunt(species)
+        for prey in self.diet[species]:
+            agent.hunt(prey)
+
+    # move all agents one step at a time until all are satiated
+    # satiated agents never move again (food only disappears and their energy only drops),
+    # so they are retired from the pass and settled up once the generation is over
+    # every mobile species shares the pass, in declaration order; when some species hunt,
+    # the species involved are indexed by cell and each move is followed by an encounter
+    def run_ticks(self):
+        record = self.recorder.record if self.recorder is not None else None
+        hunting = bool(self.hunting)
+        self.cells = {name: Occupancy(self.populations[name]) for name in self.hunting}
+        active = list(enumerate(self.movers()))
+        retired = []
+        passes = 0
+        while active:
+            still_active = []
+            for i, agent in active:
+                if hunting:
+                    old = (agent.x, agent.y)
+                    agent.move_to_food()
+                    self.encounter(agent, old)
+                else:
+                    agent.move_to_food()
+                if record is not None:
+                    record(passes, agent.uid, agent.x, agent.y)
+                if agent.satiated:
+                    retired.append((i, agent, passes))
+                else:
+                    still_active.append((i, agent))
+            if self.claims:
+                self.resolve_claims()
+            active = still_active
+            passes += 1
+        self.counters['ticks'] += passes
+
+        # retired agents stood still for the rest of the generation
+        if self.penalty == 'per_pass':
+            for i, agent, satiated_at in retired:
+                agent.energy -= agent.stationary_penalty * (passes - 1 - satiated_at)
+
+    # Same generation as run_ticks, but passes where an agent just keeps walking towards
+    # its food are skipped and paid for in closed form. An agent's turn in pass t is the
+    # event (t, i), with i its place in the agent list. Its target can only change when a
+    # piece of food at the target is eaten, so an agent is woken up on the turn it reaches
+    # its food, the first turn the food might no longer be worth it, or its next turn after
+    # someone else eats at its target. Satiated agents are retired as in run_ticks.
+    # A recorder only gets a sample at each event, not for the skipped passes.
+    def run_events(self):
+        record = self.recorder.record if self.recorder is not None else None
+        n = len(self.agents)
+        next_turn = [0] * n # turn of each agent's pending event, None once satiated
+        last_turn = [0] * n # last turn the agent actually took
+        heading = [None] * n # food the agent walks towards between events
+        followers = {} # food -> agents heading for it
+        queue = [(0, i) for i in range(n)]
+        final_pass = 0
+
+        while queue:
+            turn, i = heapq.heappop(queue)
+            if next_turn[i] != turn:
+                continue # superseded by an earlier wake-up
+            agent = self.agents[i]
+            target = heading[i]
+            if target is not None:
+                # walk through the turns that were skipped
+                agent.advance(target, (turn - last_turn[i] - 1) * agent.speed)
+                if target in followers:
+                    followers[target].discard(i)
+            last_turn[i] = turn
+            food_left = len(self.food_grid)
+            agent.move_to_food()
+            if record is not None:
+                record(turn, agent.uid, agent.x, agent.y)
+
+            if agent.satiated:
+                next_turn[i] = None
+                heading[i] = None
+                final_pass = max(final_pass, turn)
+                continue
+            if len(self.food_grid) < food_left:
+                # the agent ate here, everyone else heading for this cell has to look again
+                for j in followers.pop(agent.target, ()):
+                    wake = turn if j > i else turn + 1
+                    if wake < next_turn[j]:
+                        next_turn[j] = wake
+                        heapq.heappush(queue, (wake, j))
+                heading[i] = None
+                next_turn[i] = turn + 1
+            else:
+                heading[i] = agent.target
+                followers.setdefault(agent.target, set()).add(i)
+                next_turn[i] = turn + self.turns_until_event(agent)
+            heapq.heappush(queue, (next_turn[i], i))
+
+        if n:
+            self.counters['ticks'] += final_pass + 1
+
+        # satiated agents keep paying the penalty until the last agent is satiated
+        if self.penalty == 'per_pass':
+            for i, agent in enumerate(self.agents):
+                agent.energy -= agent.stationary_penalty * (final_pass - last_turn[i])
+
+    # the crowd of a 'genotypes' generation, the individuals left out of the movement phase,
+    # stood still for all of it, as agents that find no food worth it on their first turn:
+    # they pay stationary_penalty on that turn and, with penalty 'per_pass', on every pass
+    # after it until the spawned agents are done. They all start alike, so the crowd
+    # survives or dies as a whole
+    def settle_crowd(self, passes):
+        template = Agent(0, 0, self)
+        template.__dict__.update(self.traits[self.focal])
+        turns = max(passes, 1) if self.penalty == 'per_pass' else 1
+        self.crowd_energy = template.energy - template.stationary_penalty * turns
+
+    # speeds and sizes of the survivors of the first species, and how many individuals each
+    # stands for: None when every one is an agent, otherwise 1 for the agents and the
+    # counts of the surviving crowd's genotypes after them
+    def survivor_traits(self):
+        speeds = [agent.speed for agent in self.agents]
+        sizes = [agent.size for agent in self.agents]
+        if not len(self.crowd):
+            return speeds, sizes, None
+        crowd_speeds, crowd_sizes, counts = self.crowd.columns()
+        return speeds + crowd_speeds, sizes + crowd_sizes, [1] * len(speeds) + counts
+
+    # adds the steps the agents walked this generation to counters['path_steps'], once per
+    # generation instead of on every move
+    def count_path_steps(self):
+        steps = 0
+        for agent in self.movers():
+            steps += agent.path_steps
+            agent.path_steps = 0
+        self.counters['path_steps'] += steps
+
+    # number of turns after the current one until the agent reaches its target or the
+    # target may stop being worth the energy, whichever comes first
+    @staticmethod
+    def turns_until_event(agent):
+        speed = agent.speed
+        dist = agent.manhattan(agent.target)
+        arrival = -(-dist // speed)
+        # k turns later the check is dist - k*speed < (energy - k*speed*movement_cost) * speed
+        slope = speed * speed * agent.movement_cost - speed
+        if slope <= 0:
+            return arrival
+        surplus = agent.energy * speed - dist
+        if isinstance(surplus, int) and isinstance(slope, int):
+            give_up = surplus // slope + 1
+        else:
+            # waking up a turn early is harmless, the agent simply takes an ordinary turn
+            give_up = math.floor(surplus / slope)
+        return min(arrival, max(1, give_up))
 
     # function that simulates one generation
     def step(self):
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin(self)
+        if self.pool is not None:
+            self.agents, self.crowd = self.pool.materialize(self, self.rng, self.max_agents)
+            self.pool = None
+        ticks = self.counters['ticks']
         self.populate_food()
-        all_agents_satiated = False
-        
-        # move all agents one step at a time until all are satiated
-        while not all_agents_satiated:
-            satiation = []
-            for i, agent in enumerate(self.agents):
-                agent.move_to_food()
-                satiation.append(agent.satiated)
-                # print(i, len(self.positions), len(self.agents))
-                if len(self.positions) <= i:
-                    self.positions.append([])
-                self.positions[i].append((agent.x, agent.y))
-            all_agents_satiated = all(satiation)
+        if profiler is not None:
+            profiler.mark('populate_food')
+        if self.scheduler == 'event':
+            self.run_events()
+        elif self.use_kernel:
+            from tick_kernel import run_ticks
+            self.counters['ticks'] += run_ticks(self)
+        else:
+            self.run_ticks()
+        self.count_path_steps()
+        if len(self.crowd):
+            self.settle_crowd(self.counters['ticks'] - ticks)
+        if profiler is not None:
+            profiler.mark('movement')
         
         # remove agents with energy < 0
         self.kill_the_weak()
+        if profiler is not None:
+            profiler.mark('cull')
 
         # write metrics to lists for examiniation
         self.remaining_food.append(len(self.food_grid))
-        if len(self.agents) > 0:
-            self.avg_energy.append(self.calculate_energy_avg())
-            self.avg_speed.append(self.calculate_speed_avg())
-            self.avg_size.append(self.calculate_size_avg())
-            self.speed_dist.append([agent.speed for agent in self.agents])
-            self.size_dist.append([agent.size for agent in self.agents])
-        else:
-            self.avg_energy.append(0)
-            self.avg_speed.append(0)
-            self.avg_size.append(0)
-            self.speed_dist.append([0])
-            self.size_dist.append([0])
+        self.avg_energy.append(self.energy_stats.summary().mean)
+        self.avg_speed.append(self.speed_stats.summary().mean)
+        self.avg_size.append(self.size_stats.summary().mean)
+        speeds, sizes, weights = self.survivor_traits()
+        self.speed_dist.add(speeds, weights)
+        self.size_dist.add(sizes, weights)
+        if profiler is not None:
+            profiler.mark('metrics')
 
         # REALLOCATION OF SURVIVING AGENTS AND REPRODUCTION
-        num_survivors = len(self.agents)
-        new_agents = []
-        # random mutation occurs with the following odds
-        speed_boost = {-1:1, 0:8, 1:1}
-        size_boost = {0.85:1, 1:8, 1.15:1}
-
-        for _ in range(num_survivors):
-            # all surviving agents persist the next generation
-            parent = random.choice(self.agents)
-            parent.x = random.randint(0, self.width)
-            parent.y = random.randint(0, self.height)
-            parent_speed = parent.speed
-            parent_size = parent.size
-            new_parent = Agent(parent.x, parent.y, self)
-            # all surviving agents will replicate
-            new_parent.speed = parent_speed
-            new_parent.size = parent_size
-            new_agents.append(new_parent)
-            # speed of child randomly mutates
-            speed = parent_speed + random.choices(list(speed_boost.keys()), weights=list(speed_boost.values()), k=1)[0]
-            size = parent_size * random.choices(list(size_boost.keys()), weights=list(size_boost.values()), k=1)[0]
-            # minimums
-            if speed == 0:
-                speed = 1
-            if size <= 0.1:
-                size = 0.1
-            child_agent = Agent(random.randint(0, self.width), random.randint(0, self.height), self)
-            child_agent.speed = speed
-            child_agent.size = size
-            new_agents.append(child_agent)
-        
-        self.agents = new_agents
+        if self.population == 'genotypes':
+            self.reproduce_genotypes()
+        else:
+            self.reproduce()
+            # Add current number of agents to list
+            for name, counts in self.counts.items():
+                counts.append(len(self.populations[name]))
+        if profiler is not None:
+            profiler.mark('reproduce')
+            profiler.end(self, self.num_food - self.remaining_food[-1])
 
-        # Add current number of agents to list
-        self.agent_counts.append(len(self.agents))
-        
-        return self.agents, self.food_grid, self.positions
+        self.generation += 1
+        return self.agents, self.food_grid, self.recorder
+
+    # CHECKPOINTS
+    # everything needed to carry on from here, as flat arrays (see checkpoint.py);
+    # only valid between generations, a recorder is not included
+    def state(self):
+        internal, gauss_next = get_random_state()
+        meta = {
+            'width': self.width, 'height': self.height, 'num_food': self.num_food,
+            'food_index': [name for name, kind in FOOD_INDEXES.items() if kind is self.food_index_type][0],
+            'contention': self.contention, 'scheduler': self.scheduler, 'penalty': self.penalty,
+            'population': self.population, 'max_agents': self.max_agents, 'species': [species_to_json(species) for species in self.species],
+            'speed_boost': list(self.speed_boost.items()), 'size_boost': list(self.size_boost.items()),
+            'generation': self.generation, 'next_uid': self.next_uid, 'counters': self.counters,
+            'gauss_next': gauss_next, 'rng': self.rng.bit_generator.state,
+        }
+        state = agent_columns(self.agents, 'agent')
+        for species in self.species[1:]:
+            state.update(agent_columns(self.populations[species.name], species.name))
+            state[species.name + '_counts'] = np.array(self.counts[species.name])
+        state.update({
+            'meta': np.array(json.dumps(meta)),
+            'random_state': internal,
+            'food': np.array(list(self.food_grid), dtype=np.int64).reshape(-1, 2),
+            'agent_counts': np.array(self.agent_counts),
+            'remaining_food': np.array(self.remaining_food),
+            'avg_energy': np.array(self.avg_energy, dtype=np.float64),
+            'avg_speed': np.array(self.avg_speed, dtype=np.float64),
+            'avg_size': np.array(self.avg_size, dtype=np.float64),
+            'speed_dist': self.speed_dist.as_array(), 'speed_last': self.speed_dist.last,
+            'size_dist': self.size_dist.as_array(), 'size_last': self.size_dist.last,
+        })
+        if self.pool is not None:
+            state['pool_speed'] = np.array([g[0] for g in self.pool.counts])
+            state['pool_size'] = np.array([g[1] for g in self.pool.counts], dtype=np.float64)
+            state['pool_count'] = np.array(list(self.pool.counts.values()), dtype=np.int64)
+        return state
+
+    # rebuilds an Environment from state() and puts both random generators back
+    @classmethod
+    def from_state(cls, state, recorder=None, profiler=None):
+        meta = state['meta']
+        env = cls(meta['width'], meta['height'], 0, meta['num_food'], food_index=meta['food_index'], contention=meta['contention'],
+                  scheduler=meta['scheduler'], penalty=meta['penalty'], speed_boost=dict(meta['speed_boost']), size_boost=dict(meta['size_boost']),
+                  population=meta['population'], max_agents=meta.get('max_agents'), recorder=recorder, profiler=profiler, species=[species_from_json(s) for s in meta['species']])
+        env.agents = spawn_columns(env, state, 'agent')
+        for species in env.species[1:]:
+            env.populations[species.name] = spawn_columns(env, state, species.name, species.name)
+            env.counts[species.name] = state[species.name + '_counts'].tolist()
+        env.next_uid = meta['next_uid']
+        env.generation = meta['generation']
+        env.counters.update(meta['counters'])
+        env.food_grid = FoodStore([tuple(f) for f in state['food'].tolist()])
+        env.agent_counts = state['agent_counts'].tolist()
+        env.remaining_food = state['remaining_food'].tolist()
+        env.avg_energy = state['avg_energy'].tolist()
+        env.avg_speed = state['avg_speed'].tolist()
+        env.avg_size = state['avg_size'].tolist()
+        env.speed_dist.counts = list(state['speed_dist'])
+        env.speed_dist.last = state['speed_last']
+        env.size_dist.counts = list(state['size_dist'])
+        env.size_dist.last = state['size_last']
+        if 'pool_count' in state:
+            env.pool = GenotypePool(zip(zip(state['pool_speed'].tolist(), state['pool_size'].tolist()), state['pool_count'].tolist()))
+        env.rng.bit_generator.state = meta['rng']
+        set_random_state(state['random_state'], meta['gauss_next'])
+        return env
+
+    def save(self, path):
+        write_checkpoint(path, self.state())
+
+    @classmethod
+    def load(cls, path, recorder=None, profiler=None):
+        return cls.from_state(read_checkpoint(path), recorder, profiler)
+
+    # turnover of every species, one after the other: int(survivors * turnover) random
+    # parents (with replacement) each persist unchanged and spawn one mutated child,
+    # so with turnover 1 every survivor slot is refilled; a species is drawn at once
+    def reproduce(self):
+        for species in self.species:
+            population = self.populations[species.name]
+            speed_table, size_table = self.tables[species.name]
+            speeds, sizes = breed(self.rng, [agent.speed for agent in population], [agent.size for agent in population], int(len(population) * species.turnover), speed_table, size_table)
+            xs = self.rng.integers(0, self.width + 1, len(speeds)).tolist()
+            ys = self.rng.integers(0, self.height + 1, len(speeds)).tolist()
+            new_population = []
+            for x, y, speed, size in zip(xs, ys, speeds.tolist(), sizes.tolist()):
+                agent = self.spawn(x, y, species.name)
+                agent.speed = speed
+                agent.size = size
+                new_population.append(agent)
+            self.populations[species.name] = new_population
+
+    # turnover on genotype counts, the surviving crowd included; the survivors are released
+    # and the next generation is only spawned when the next step needs it
+    def reproduce_genotypes(self):
+        survivors = GenotypePool.from_agents(self.agents)
+        survivors.update(self.crowd)
+        self.pool = survivors.reproduce(self.rng, self.speed_boost, self.size_boost)
+        self.crowd = GenotypePool()
+        self.agents = []
+        self.agent_counts.append(len(self.pool))
 
     # Function that generates animation in gif format
-    def animate_generation(self, env, iterations, num_agents):
-            
-        plt.switch_backend('Agg') # don't show plot
-        fig, (ax1, ax2) = plt.subplots(2, 1)
-
-        # ax1 for agents and food locations in scatter plot
-        ax1.set_xlim(0, self.width)
-        ax1.set_ylim(0, self.height)
-        ax1.set_title('Agents location')
-        ax1.set_xlabel('X')
-        ax1.set_ylabel('Y')
-        
-        # ax2 for number of agents over time (generations)
-        ax2.set_title('Number of Agents')
-        ax2.set_xlabel('Generations')
-        ax2.set_ylabel('Number of Agents')
-        ax2.set_xlim(0, iterations)
-        ax2.set_ylim(0, int(num_agents*1.5))
-        ax2.set_xticks(np.arange(0, iterations, 1))
-        ax2.set_yticks(np.arange(0, int(num_agents*1.5), int(num_agents*0.2)))
-        
-        fig.set_figheight(8)
-        fig.set_figwidth(5)
-        fig.tight_layout()
-        
-        # initialise each plot
-        scat_agents = ax1.scatter([a.x for a in self.agents], [a.y for a in self.agents], c='k', s=30, marker='*', label='Agent')
-        scat_food = ax1.scatter([f[0] for f in self.food_grid], [f[1] for f in self.food_grid], c='r', s=30, marker='x', label='Food')
-        line_agents, = ax2.plot([], [], c='k') # initialise empty line_agents
-
-        num_agents_list = [num_agents]
-
-        def update(frame_number):
-            agent, food, pos = env.step()
-            
-            scat_agents.set_offsets(np.c_[[a.x for a in agent], [a.y for a in agent]])
-            scat_food.set_offsets(np.c_[[f[0] for f in food], [f[1] for f in food]])
-            
-            num_agents = len(self.agents)
-            
-            # update the title of scatter plot
-            ax1.set_title('Agents location - Generation #%i (No. of Agents: %s)' %(frame_number, num_agents))
-            
-            # monitor the number of agents at each generation
-            num_agents_list.append(num_agents)
-            line_agents.set_data(range(len(num_agents_list)), num_agents_list)
-            
-            return scat_agents, line_agents
-        
-        # Legend for each figure
-        ax1.legend(loc='lower center', bbox_to_anchor = (0.5, -0.3), ncol=2)
-        plt.subplots_adjust(wspace=0, hspace=0.4)
-        
-        # interval = delay between frames in milliseconds, e.g., 500 = 0.5 sec for each frame
-        # blit = optimise drawing
-        ani = animation.FuncAnimation(fig=fig,
-                                        func=update,
-                                        frames=iterations,
-                                        interval=500,
-                                        blit=False,
-                                        repeat=True,
-                                        )
+    # replays the run recorded so far, needs an Environment(recorder=...)
+    # every=k draws every k-th time step, per_generation=True one frame per generation
+    def animate_generation(self, path=None, every=1, per_generation=False):
+        if self.recorder is None:
+            raise ValueError('animate_generation needs an Environment created with a recorder')
+        from visualization import render_run
         mypath = os.path.dirname(os.path.abspath(__file__)) + '/'
-        # writergif = animation.PillowWriter(fps=30)
-        # ani.save(mypath + "animation.gif", writer=writergif)
-        ani.save(mypath + 'animation.gif', writer='pillow')
+        render_run(self.recorder, path or mypath + 'animation.gif', self.agent_counts, every, per_generation)
     
-    def animate_agent(self):
+    # one gif per recorded agent, needs an Environment(recorder=...)
+    # workers > 1 renders on a process pool; sample=n draws n random agents and top=n
+    # keeps the n that were recorded longest
+    def animate_agent(self, every=1, workers=1, sample=None, top=None, progress=True):
+        if self.recorder is None:
+            raise ValueError('animate_agent needs an Environment created with a recorder')
+        from visualization import render_agents
         mypath = os.path.dirname(os.path.abspath(__file__)) + '/'
-        figs = []
-        for i in range(len(self.positions)):
-            figs.append(plt.figure())
-            
-            def update(frame_number):
-                plt.clf()
-                plt.xlim([0,self.width])
-                plt.ylim([0,self.height])
-                plt.title(f"Time Step: {frame_number}")
-                x_values = [x[0] for x in self.positions[i][:frame_number]]
-                y_values = [y[1] for y in self.positions[i][:frame_number]]
-                plt.plot(x_values, y_values)
-                
-                # food_x_values = [x[0] for x in self.food_positions[frame_number]]
-                # food_y_values = [y[1] for y in self.food_positions[frame_number]]
-                # plt.scatter(food_x_values, food_y_values)
-                
-            ani = animation.FuncAnimation(fig=figs[i],
-                                      func=update,
-                                      frames=len(self.positions[0]),
-                                      interval=100,
-                                      repeat=True)
-            
-            ani.save(mypath + f'individual_agents_animation/animation_agent_#{i}.gif', writer='pillow')
+        render_agents(self.recorder, mypath + 'individual_agents_animation', every=every, workers=workers, sample=sample, top=top, progress=progress)
 
 # DRIVER ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-def simulate(x, y, iterations, num_agents, num_food) :
-    env = Environment(x, y, num_agents, num_food)
-    #env.animate_generation(env, iterations, num_agents)
-    #env.animate_agent(env, num_agents)
-    for i in range(iterations) :
-        print("Iteration Number " + str(i+1))
-        print("Total Population: " + str(env.agent_counts[i]))
-        # print("Speed Distribution: " + str(env.speed_dist))
+# engine: 'object' runs one Agent object at a time, 'array' runs the NumPy engine in array_engine.py
+# when left as None the NS_ENGINE environment variable picks the engine, defaulting to 'object'
+# speed_boost / size_boost override the mutation tables
+def make_environment(x, y, num_agents, num_food, engine=None, speed_boost=None, size_boost=None):
+    engine = engine or os.environ.get('NS_ENGINE', 'object')
+    if engine == 'array':
+        from array_engine import ArrayEnvironment
+        return ArrayEnvironment(x, y, num_agents, num_food, speed_boost=speed_boost, size_boost=size_boost)
+    elif engine != 'object':
+        raise ValueError('unknown engine: ' + str(engine))
+    return Environment(x, y, num_agents, num_food, speed_boost=speed_boost, size_boost=size_boost)
+
+
+# steps env up to `iterations` generations in total and yields a GenerationRecord as
+# soon as each generation is done, stop iterating to stop the run; verbose prints the
+# progress lines. stop is a StopCriteria (code/stopping.py) that can end the run
+# earlier, env.stop_reason says why it did
+def run_generations(env, iterations, verbose=False, stop=None):
+    env.stop_reason = None
+    for i in range(len(env.remaining_food), iterations):
+        if verbose:
+            print("Iteration Number " + str(i+1))
+            for line in env.progress(i):
+                print(line)
         env.step()
-        
-        if i == iterations - 1 :
-            # print(env.agent_counts)
-            return(env.agent_counts, env.avg_energy, env.avg_speed, env.avg_size, env.speed_dist, env.size_dist)
\ No newline at end of file
+        yield env.record()
+        if stop is not None:
+            env.stop_reason = stop.reason(env)
+            if env.stop_reason is not None:
+                if verbose:
+                    print("Stopped: " + env.stop_reason)
+                return
+
+
+def iter_generations(x, y, iterations, num_agents, num_food, engine=None, speed_boost=None, size_boost=None, verbose=False, stop=None):
+    env = make_environment(x, y, num_agents, num_food, engine, speed_boost, size_boost)
+    return run_generations(env, iterations, verbose, stop)
+
+
+# runs env up to `iterations` generations and returns env.series(), shared by the
+# simulate() drivers; checkpoint is the path of a checkpoint file written every
+# checkpoint_every generations in the background (object engine only), stop is a
+# StopCriteria that can end the run early, the series are then truncated or padded as it says
+def run_simulation(env, iterations, verbose=False, checkpoint=None, checkpoint_every=10, stop=None):
+    checkpointer = None
+    if checkpoint is not None:
+        if not isinstance(env, Environment):
+            raise ValueError('checkpoints are only supported by the object engine')
+        checkpointer = Checkpointer(checkpoint, checkpoint_every)
+    try:
+        for record in run_generations(env, iterations, verbose, stop):
+            if checkpointer is not None:
+                checkpointer.after_generation(env)
+    finally:
+        if checkpointer is not None:
+            checkpointer.close()
+    result = env.series()
+    return stop.finish(result, env, iterations) if stop is not None else result
+
+
+# runs all iterations and returns the full per-generation lists
+# if the checkpoint file already exists the run carries on from it
+def simulate(x, y, iterations, num_agents, num_food, engine=None, speed_boost=None, size_boost=None, verbose=False, checkpoint=None, checkpoint_every=10, stop=None) :
+    if checkpoint is not None and os.path.exists(checkpoint):
+        env = Environment.load(checkpoint)
+    else:
+        env = make_environment(x, y, num_agents, num_food, engine, speed_boost, size_boost)
+    return run_simulation(env, iterations, verbose, checkpoint, checkpoint_every, stop)
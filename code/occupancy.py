@@ -0,0 +1,41 @@
+# OCCUPANCY INDEX ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Who stands on which cell: {(x, y): [entity, ...]} in arrival order, kept up
+# to date by the caller as entities move, so "who is here" is a dict lookup
+# instead of a scan over every entity.
+class Occupancy:
+    def __init__(self, entities=()):
+        self.cells = {}
+        for entity in entities:
+            self.add(entity)
+
+    def __len__(self):
+        return sum(len(here) for here in self.cells.values())
+
+    def add(self, entity):
+        self.cells.setdefault((entity.x, entity.y), []).append(entity)
+
+    # entities on cell, None when it is empty
+    def get(self, cell):
+        return self.cells.get(cell)
+
+    def remove(self, entity, cell=None):
+        cell = (entity.x, entity.y) if cell is None else cell
+        here = self.cells[cell]
+        here.remove(entity)
+        if not here:
+            del self.cells[cell]
+
+    # entity has moved from old to its current cell
+    def move(self, entity, old):
+        self.remove(entity, old)
+        self.add(entity)
+
+    # removes and returns the latest arrival on cell, None when it is empty
+    def take(self, cell):
+        here = self.cells.get(cell)
+        if not here:
+            return None
+        entity = here.pop()
+        if not here:
+            del self.cells[cell]
+        return entity
@@ -0,0 +1,74 @@
+import time
+from collections import namedtuple
+
+# STEP PROFILER ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Wall time per phase of Environment.step() and per-generation work counts.
+# Attach with Environment(profiler=StepProfiler(...)); without one, step() only
+# pays a handful of None checks per generation.
+#
+# phases: 'populate_food', 'movement', 'cull', 'metrics', 'reproduce'
+# counts: the change in every Environment.counters entry over the generation
+#   (ticks, nearest_queries, cached_targets, distance_evals, path_steps),
+#   plus food_consumed and agents_created
+
+PHASES = ('populate_food', 'movement', 'cull', 'metrics', 'reproduce')
+
+# one generation: its index, total seconds, {phase: seconds} and {count: n}
+GenerationProfile = namedtuple('GenerationProfile', ['generation', 'seconds', 'phases', 'counts'])
+
+
+class StepProfiler:
+    # callback(profile) is called with every GenerationProfile as it is finished;
+    # keep=False only hands the profiles to the hooks
+    def __init__(self, callback=None, keep=True, clock=time.perf_counter):
+        self.hooks = [callback] if callback is not None else []
+        self.keep = keep
+        self.clock = clock
+        self.profiles = []
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    # called by Environment.step
+    def begin(self, env):
+        self.counters = dict(env.counters)
+        self.next_uid = env.next_uid
+        self.phases = {}
+        self.started = self.last = self.clock()
+
+    # closes the phase that has been running since the last mark
+    def mark(self, phase):
+        now = self.clock()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def end(self, env, food_consumed):
+        counts = {name: value - self.counters.get(name, 0) for name, value in env.counters.items()}
+        counts['food_consumed'] = food_consumed
+        counts['agents_created'] = env.next_uid - self.next_uid
+        profile = GenerationProfile(env.generation, self.last - self.started, self.phases, counts)
+        if self.keep:
+            self.profiles.append(profile)
+        for hook in self.hooks:
+            hook(profile)
+        return profile
+
+    # phases and counts summed over every kept generation
+    def totals(self):
+        phases = {}
+        counts = {}
+        for profile in self.profiles:
+            for name, seconds in profile.phases.items():
+                phases[name] = phases.get(name, 0.0) + seconds
+            for name, n in profile.counts.items():
+                counts[name] = counts.get(name, 0) + n
+        return GenerationProfile(None, sum(p.seconds for p in self.profiles), phases, counts)
+
+    # one line per generation, phases as a share of the generation's time
+    def report(self):
+        lines = []
+        for profile in self.profiles:
+            shares = ' '.join('%s=%.0f%%' % (name, 100 * profile.phases.get(name, 0.0) / (profile.seconds or 1)) for name in PHASES)
+            counts = ' '.join('%s=%d' % item for item in sorted(profile.counts.items()))
+            lines.append('generation %d: %.4fs %s %s' % (profile.generation, profile.seconds, shares, counts))
+        return '\n'.join(lines)
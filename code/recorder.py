@@ -0,0 +1,209 @@
+import json
+import os
+from array import array
+from collections import deque
+import numpy as np
+
+# TRAJECTORY RECORDER ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Agent positions and food layouts of a run, stored as compact typed columns.
+# A sample is (generation, tick, agent uid, x, y): 16 bytes for maps that fit
+# in int16 coordinates, 20 bytes otherwise. Samples are gathered in typed
+# buffers and flushed in chunks of chunk_size samples.
+#
+# modes:
+#   'memory' keeps every chunk in memory
+#   'ring'   keeps only the samples of the last `capacity` ticks, counted across
+#            generations
+#   'stream' appends chunks to the file at `path` (plus path.food for food and
+#            path.json describing the columns), see TrajectoryRecorder.load
+# An Environment without a recorder records nothing and pays nothing for it.
+#
+# Agents are sampled on every tick they move; once satiated they stay where
+# their last sample puts them.
+
+def sample_dtype(coord):
+    return np.dtype([('generation', '<i4'), ('tick', '<i4'), ('agent', '<i4'), ('x', coord), ('y', coord)])
+
+
+def food_dtype(coord):
+    return np.dtype([('generation', '<i4'), ('x', coord), ('y', coord)])
+
+
+class TrajectoryRecorder:
+    def __init__(self, mode='memory', capacity=None, path=None, chunk_size=1 << 16):
+        if mode not in ('memory', 'ring', 'stream'):
+            raise ValueError('unknown recording mode: ' + str(mode))
+        if mode == 'ring' and not capacity:
+            raise ValueError("'ring' recording needs a capacity in ticks")
+        if mode == 'stream' and not path:
+            raise ValueError("'stream' recording needs a path")
+        self.mode = mode
+        self.capacity = capacity
+        self.path = path
+        self.chunk_size = chunk_size
+        self.width = None
+        self.height = None
+        self.generation = 0
+        self.tick_offset = 0 # ticks recorded in earlier generations, for the ring
+        self.generation_ticks = 0
+        self.chunks = deque()
+        self.food_chunks = deque()
+        self.stored = 0 # samples flushed so far
+        self._reset_buffers()
+
+    def _reset_buffers(self):
+        self.ticks = array('i')
+        self.agents = array('i')
+        self.xs = array('i')
+        self.ys = array('i')
+
+    # called by the Environment, picks the coordinate width
+    def bind(self, width, height):
+        self.width = width
+        self.height = height
+        coord = '<i2' if max(width, height) < 2 ** 15 else '<i4'
+        self.dtype = sample_dtype(coord)
+        self.food_dtype = food_dtype(coord)
+        if self.mode == 'stream':
+            self.file = open(self.path, 'wb')
+            self.food_file = open(self.path + '.food', 'wb')
+            with open(self.path + '.json', 'w') as meta:
+                json.dump({'samples': self.dtype.descr, 'food': self.food_dtype.descr, 'width': width, 'height': height}, meta)
+
+    def begin_generation(self, generation):
+        self.flush()
+        self.tick_offset += self.generation_ticks
+        self.generation_ticks = 0
+        self.generation = generation
+
+    def record(self, tick, agent, x, y):
+        self.ticks.append(tick)
+        self.agents.append(agent)
+        self.xs.append(x)
+        self.ys.append(y)
+        if len(self.ticks) >= self.chunk_size:
+            self.flush()
+
+    # food laid out at the start of the current generation, stacked pieces repeated
+    def record_food(self, food):
+        chunk = np.zeros(len(food), dtype=self.food_dtype)
+        chunk['generation'] = self.generation
+        if len(food):
+            chunk['x'], chunk['y'] = np.array(food).T
+        if self.mode == 'stream':
+            self.food_file.write(chunk.tobytes())
+        else:
+            self.food_chunks.append(chunk)
+
+    def flush(self):
+        n = len(self.ticks)
+        if n == 0:
+            return
+        chunk = np.empty(n, dtype=self.dtype)
+        chunk['generation'] = self.generation
+        chunk['tick'] = np.frombuffer(self.ticks, dtype=np.int32)
+        chunk['agent'] = np.frombuffer(self.agents, dtype=np.int32)
+        chunk['x'] = np.frombuffer(self.xs, dtype=np.int32)
+        chunk['y'] = np.frombuffer(self.ys, dtype=np.int32)
+        self.generation_ticks = max(self.generation_ticks, int(chunk['tick'].max()) + 1)
+        self._reset_buffers()
+        self.stored += n
+        if self.mode == 'stream':
+            self.file.write(chunk.tobytes())
+        elif self.mode == 'ring':
+            self.chunks.append((self.tick_offset, chunk))
+            self._trim()
+        else:
+            self.chunks.append(chunk)
+
+    # drop ring chunks that hold nothing from the last `capacity` ticks
+    def _trim(self):
+        oldest = self.tick_offset + self.generation_ticks - self.capacity
+        while self.chunks and self.chunks[0][0] + int(self.chunks[0][1]['tick'].max()) < oldest:
+            offset, chunk = self.chunks.popleft()
+            self.stored -= len(chunk)
+        first_generation = self.chunks[0][1]['generation'][0] if self.chunks else self.generation
+        while self.food_chunks and self.food_chunks[0]['generation'][0] < first_generation:
+            self.food_chunks.popleft()
+
+    def close(self):
+        self.flush()
+        if self.mode == 'stream' and not self.file.closed:
+            self.file.close()
+            self.food_file.close()
+
+    # all retained samples as one structured array
+    def samples(self):
+        self.flush()
+        if self.mode == 'stream':
+            self.file.flush()
+            return np.fromfile(self.path, dtype=self.dtype)
+        if self.mode == 'ring':
+            if not self.chunks:
+                return np.zeros(0, dtype=self.dtype)
+            offsets = np.concatenate([np.full(len(c), o) for o, c in self.chunks])
+            data = np.concatenate([c for o, c in self.chunks])
+            keep = offsets + data['tick'] >= self.tick_offset + self.generation_ticks - self.capacity
+            return data[keep]
+        if not self.chunks:
+            return np.zeros(0, dtype=self.dtype)
+        if len(self.chunks) > 1:
+            self.chunks = deque([np.concatenate(self.chunks)])
+        return self.chunks[0]
+
+    # food layouts as one structured array of (generation, x, y)
+    def food(self, generation=None):
+        if self.mode == 'stream':
+            self.food_file.flush()
+            data = np.fromfile(self.path + '.food', dtype=self.food_dtype)
+        elif self.food_chunks:
+            data = np.concatenate(self.food_chunks)
+        else:
+            data = np.zeros(0, dtype=self.food_dtype)
+        return data if generation is None else data[data['generation'] == generation]
+
+    def agent_ids(self):
+        return np.unique(self.samples()['agent'])
+
+    # x and y of one agent over time
+    def trajectory(self, agent):
+        data = self.samples()
+        data = data[data['agent'] == agent]
+        data = data[np.lexsort((data['tick'], data['generation']))]
+        return data['x'], data['y']
+
+    # (uid, xs, ys) for every agent (or just uids), from a single sort of the samples
+    def trajectories(self, uids=None):
+        data = self.samples()
+        data = data[np.lexsort((data['tick'], data['generation'], data['agent']))]
+        agents = data['agent']
+        starts = np.flatnonzero(np.r_[True, agents[1:] != agents[:-1]])
+        ends = np.r_[starts[1:], len(data)].astype(int)
+        wanted = None if uids is None else set(uids)
+        for start, end in zip(starts, ends):
+            uid = int(agents[start])
+            if wanted is None or uid in wanted:
+                yield uid, data['x'][start:end], data['y'][start:end]
+
+    def nbytes(self):
+        return self.stored * self.dtype.itemsize
+
+    # read back a streamed recording, memory-mapped
+    @classmethod
+    def load(cls, path):
+        with open(path + '.json') as meta:
+            meta = json.load(meta)
+        recorder = cls('memory')
+        recorder.width = meta['width']
+        recorder.height = meta['height']
+        recorder.dtype = np.dtype([tuple(field) for field in meta['samples']])
+        recorder.food_dtype = np.dtype([tuple(field) for field in meta['food']])
+        if os.path.getsize(path):
+            samples = np.memmap(path, dtype=recorder.dtype, mode='r')
+        else:
+            samples = np.zeros(0, dtype=recorder.dtype)
+        recorder.chunks.append(samples)
+        recorder.stored = len(samples)
+        recorder.food_chunks.append(np.fromfile(path + '.food', dtype=recorder.food_dtype))
+        return recorder
+
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import random
+import numpy as np
+from checkpoint import write_checkpoint, read_checkpoint
+from stats import TraitHistogram
+
+# RESULT CACHE ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# simulate() results on disk, keyed by everything that decides them: the model
+# (natural_selection or predator_extension), the arguments, the mutation tables,
+# the engine, the seed and a hash of the simulation source files. Each result is
+# a .npz of the returned series (histograms as their bin edges, counts and last
+# values), named after its key, so a hit is one np.load.
+#
+# Editing any file in ENGINE_SOURCES changes every key, so results of the old
+# code are never returned; prune_stale() deletes them and clear() empties the
+# cache. Once the files add up to more than max_bytes, the least recently used
+# ones are deleted. Several processes can share a directory: a file another one
+# deletes first counts as a miss or as already gone.
+#
+#   cache = ResultCache('~/.cache/natural_selection')
+#   result = cache.simulate(100, 100, 50, 10, 100, seed=1)   # runs and stores
+#   result = cache.simulate(100, 100, 50, 10, 100, seed=1)   # loads
+
+ENGINE_SOURCES = ('natural_selection.py', 'predator_extension.py', 'array_engine.py', 'tick_kernel.py', 'mutation.py', 'genotypes.py', 'food_index.py', 'food_store.py', 'occupancy.py', 'stats.py')
+MODELS = ('natural_selection', 'predator_extension')
+
+code_hash = None
+
+
+# sha256 of the simulation sources, worked out once per process
+def engine_version():
+    global code_hash
+    if code_hash is None:
+        digest = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in ENGINE_SOURCES:
+            digest.update(name.encode())
+            with open(os.path.join(here, name), 'rb') as f:
+                digest.update(f.read())
+        code_hash = digest.hexdigest()
+    return code_hash
+
+
+# the simulate() tuple as arrays: lists as s<i>, TraitHistograms as h<i>_edges/_counts/_last
+def result_arrays(result):
+    arrays = {}
+    for i, value in enumerate(result):
+        if isinstance(value, TraitHistogram):
+            arrays['h%d_edges' % i] = value.edges
+            arrays['h%d_counts' % i] = value.as_array()
+            arrays['h%d_last' % i] = value.last
+        else:
+            arrays['s%d' % i] = np.array(value)
+    return arrays
+
+
+def result_from_arrays(arrays, length):
+    result = []
+    for i in range(length):
+        if 's%d' % i in arrays:
+            result.append(arrays['s%d' % i].tolist())
+        else:
+            histogram = TraitHistogram(arrays['h%d_edges' % i])
+            histogram.counts = list(arrays['h%d_counts' % i])
+            histogram.last = arrays['h%d_last' % i]
+            result.append(histogram)
+    return tuple(result)
+
+
+# deletes path, returns False if another process already did
+def remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+class ResultCache:
+    def __init__(self, directory, max_bytes=256 << 20):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    # content address of one run; boosts of None stand for the model's default tables
+    def key(self, model, x, y, iterations, num_agents, num_food, seed, engine=None, speed_boost=None, size_boost=None):
+        params = {
+            'model': model, 'args': [x, y, iterations, num_agents, num_food], 'seed': seed, 'engine': engine,
+            'speed_boost': sorted(speed_boost.items()) if speed_boost is not None else None,
+            'size_boost': sorted(size_boost.items()) if size_boost is not None else None,
+            'version': engine_version(),
+        }
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    # the cached result for key, None on a miss; a hit counts as a use for eviction
+    def get(self, key):
+        path = self.path(key)
+        try:
+            state = read_checkpoint(path)
+            os.utime(path)
+        except FileNotFoundError:
+            # never stored, or evicted by another process sharing the directory
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result_from_arrays(state, state['meta']['length'])
+
+    def put(self, key, result, meta=None):
+        state = result_arrays(result)
+        state['meta'] = np.array(json.dumps(dict(meta or {}, length=len(result), version=engine_version())))
+        write_checkpoint(self.path(key), state)
+        self.evict()
+
+    # runs model.simulate() with random.seed(seed), or loads the result of an identical
+    # earlier run; engine, speed_boost and size_boost only apply to natural_selection
+    # an unseeded run is not reproducible, so seed must be given
+    def simulate(self, x, y, iterations, num_agents, num_food, seed, model='natural_selection', engine=None, speed_boost=None, size_boost=None):
+        if model not in MODELS:
+            raise ValueError('unknown model: ' + str(model))
+        if seed is None:
+            raise ValueError('cached runs need a seed')
+        if model == 'natural_selection':
+            engine = engine or os.environ.get('NS_ENGINE', 'object')
+        key = self.key(model, x, y, iterations, num_agents, num_food, seed, engine, speed_boost, size_boost)
+        result = self.get(key)
+        if result is not None:
+            return result
+        random.seed(seed)
+        if model == 'natural_selection':
+            from natural_selection import simulate
+            result = simulate(x, y, iterations, num_agents, num_food, engine=engine, speed_boost=speed_boost, size_boost=size_boost)
+        else:
+            from predator_extension import simulate
+            result = simulate(x, y, iterations, num_agents, num_food)
+        self.put(key, result, {'model': model, 'args': [x, y, iterations, num_agents, num_food], 'seed': seed})
+        return result
+
+    def entries(self):
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.npz')]
+
+    # (mtime, size, path) of every entry; entries another process deletes meanwhile are left out
+    def stats(self):
+        found = []
+        for path in self.entries():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            found.append((stat.st_mtime_ns, stat.st_size, path))
+        return found
+
+    def size(self):
+        return sum(size for _, size, _ in self.stats())
+
+    # deletes the least recently used entries until the cache fits in max_bytes
+    def evict(self):
+        entries = sorted(self.stats())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            remove(path)
+            total -= size
+
+    # deletes the entries written by another version of the simulation code
+    def prune_stale(self):
+        removed = 0
+        for path in self.entries():
+            try:
+                version = read_checkpoint(path)['meta'].get('version')
+            except FileNotFoundError:
+                continue
+            if version != engine_version():
+                removed += remove(path)
+        return removed
+
+    def clear(self):
+        for path in self.entries():
+            remove(path)
@@ -0,0 +1,212 @@
+import json
+import os
+import numpy as np
+from stats import TraitHistogram
+
+# RUN RESULTS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# The output of a run as typed columns instead of the lists simulate() returns:
+#   series       one 1-D array per per-generation value, named as in simulate()
+#                (agent_counts and pred_counts have one more entry, the starting
+#                population); counts are int64, everything else float64
+#   histograms   <name> (generations x bins counts), <name>_edges and <name>_last, for
+#                speed_dist and size_dist
+#   traits       the raw speed and size of every generation's survivors, ragged:
+#                <trait>_values holds them one generation after the other and
+#                <trait>_offsets (generations + 1 entries) where each generation starts
+# to_numpy() hands out the arrays themselves and to_dataframe() wraps them without
+# copying; pandas is only imported there.
+#
+# On disk a set of runs is a directory with one raw file per column, each run's rows
+# appended to the previous run's, and meta.json with the dtypes, where every run's rows
+# start and stop, and each run's metadata. RunDataset memory-maps the files, so a scan
+# over one column of thousands of runs only reads that column.
+#
+#   results = [simulate_result(100, 100, 50, 10, 100) for _ in range(8)]
+#   write_runs('runs', results)
+#   speeds, offsets = RunDataset('runs').column('avg_speed')
+
+# names of the values simulate() returns, in order
+SIMULATE = ('agent_counts', 'avg_energy', 'avg_speed', 'avg_size', 'speed_dist', 'size_dist')
+PREDATOR_SIMULATE = ('agent_counts', 'pred_counts', 'avg_energy', 'avg_speed', 'avg_size', 'speed_dist', 'size_dist')
+TRAITS = ('speed', 'size')
+COUNT_SERIES = ('agent_counts', 'pred_counts')
+# DataFrame names of the series one entry longer, after dropping the starting population
+NEXT_POPULATION = {'agent_counts': 'population', 'pred_counts': 'predators'}
+
+
+class RunResult:
+    # arrays is {column name: array}, layout the [name, 'series' | 'histogram'] pairs of
+    # the simulate() tuple in order, meta anything JSON can hold (settings, seed, ...)
+    def __init__(self, arrays, layout, traits=(), meta=None):
+        self.arrays = arrays
+        self.layout = [list(entry) for entry in layout]
+        self.traits = list(traits)
+        self.meta = dict(meta or {})
+
+    # a simulate() tuple (names as in SIMULATE or PREDATOR_SIMULATE), with traits
+    # ({trait: [values of each generation]}) when they were collected
+    @classmethod
+    def from_tuple(cls, result, names=SIMULATE, traits=None, meta=None):
+        arrays = {}
+        layout = []
+        for name, value in zip(names, result):
+            if isinstance(value, TraitHistogram):
+                arrays[name] = value.as_array()
+                arrays[name + '_edges'] = value.edges
+                arrays[name + '_last'] = np.asarray(value.last, dtype=np.float64)
+                layout.append((name, 'histogram'))
+            else:
+                arrays[name] = np.array(value, dtype=np.int64 if name in COUNT_SERIES else np.float64)
+                layout.append((name, 'series'))
+        for trait, generations in (traits or {}).items():
+            arrays[trait + '_values'] = np.concatenate([np.zeros(0)] + [np.asarray(values, dtype=np.float64) for values in generations])
+            arrays[trait + '_offsets'] = np.r_[0, np.cumsum([len(values) for values in generations])].astype(np.int64)
+        return cls(arrays, layout, list(traits or ()), meta)
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __len__(self):
+        for name, kind in self.layout:
+            if kind == 'histogram':
+                return len(self.arrays[name])
+        return 0
+
+    # raw values of a trait in one generation, a view into the column
+    def trait(self, name, generation=-1):
+        offsets = self.arrays[name + '_offsets']
+        generation = range(len(offsets) - 1)[generation]
+        return self.arrays[name + '_values'][offsets[generation]:offsets[generation + 1]]
+
+    def histogram(self, name):
+        histogram = TraitHistogram(self.arrays[name + '_edges'])
+        histogram.counts = list(self.arrays[name])
+        histogram.last = self.arrays[name + '_last']
+        return histogram
+
+    # the same values as simulate() returned: lists and TraitHistograms
+    def as_tuple(self):
+        return tuple(self.histogram(name) if kind == 'histogram' else self.arrays[name].tolist() for name, kind in self.layout)
+
+    # {column name: array}, the arrays themselves
+    def to_numpy(self):
+        return dict(self.arrays)
+
+    # one row per generation with the series (agent_counts as the population each
+    # generation leaves, `population`, and pred_counts as `predators`), or with trait
+    # set, one row per survivor with its generation and value
+    def to_dataframe(self, trait=None):
+        import pandas as pd
+        if trait is not None:
+            offsets = self.arrays[trait + '_offsets']
+            generation = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+            return pd.DataFrame({'generation': generation, trait: self.arrays[trait + '_values']}, copy=False)
+        columns = {'generation': np.arange(len(self))}
+        for name, kind in self.layout:
+            if kind == 'series':
+                values = self.arrays[name]
+                columns[NEXT_POPULATION.get(name, name)] = values[1:] if name in NEXT_POPULATION else values
+        return pd.DataFrame(columns, copy=False)
+
+    def save(self, path):
+        write_runs(path, [self])
+
+    @classmethod
+    def load(cls, path):
+        return RunDataset(path)[0]
+
+
+# DRIVER ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# natural_selection.simulate() returning a RunResult with the survivors' raw traits
+# of every generation; stop works as in simulate(), padded generations get no
+# survivors after an extinction and the last generation's otherwise
+def simulate_result(x, y, iterations, num_agents, num_food, engine=None, speed_boost=None, size_boost=None, verbose=False, stop=None, meta=None):
+    from natural_selection import make_environment, run_generations
+    env = make_environment(x, y, num_agents, num_food, engine, speed_boost, size_boost)
+    traits = {name: [] for name in TRAITS}
+    for record in run_generations(env, iterations, verbose, stop):
+        traits['speed'].append(env.speed_dist.last)
+        traits['size'].append(env.size_dist.last)
+    result = env.series()
+    if stop is not None:
+        result = stop.finish(result, env, iterations)
+        for values in traits.values():
+            missing = len(result[1]) - len(values)
+            if missing > 0:
+                values.extend([values[-1][:0] if env.stop_reason == 'extinction' else values[-1]] * missing)
+    meta = dict({'args': [x, y, iterations, num_agents, num_food], 'stop_reason': env.stop_reason}, **(meta or {}))
+    return RunResult.from_tuple(result, SIMULATE, traits, meta)
+
+
+# RUN DATASETS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# writes results (any iterable, consumed one run at a time) to the directory path,
+# replacing a dataset already there; a column keeps the dtype of the first run that
+# has it, and later runs must cast to it safely
+def write_runs(path, results):
+    os.makedirs(path, exist_ok=True)
+    columns = {}
+    files = {}
+    runs = []
+    try:
+        for result in results:
+            rows = {}
+            for name, array in result.arrays.items():
+                array = np.asarray(array)
+                if name not in columns:
+                    columns[name] = {'dtype': array.dtype.str, 'shape': list(array.shape[1:]), 'rows': 0}
+                    files[name] = open(os.path.join(path, name + '.bin'), 'wb')
+                column = columns[name]
+                if list(array.shape[1:]) != column['shape'] or not np.can_cast(array.dtype, column['dtype'], 'same_kind'):
+                    raise ValueError('column %s: %s %s does not fit %s %s' % (name, array.dtype, array.shape[1:], column['dtype'], column['shape']))
+                files[name].write(np.ascontiguousarray(array, dtype=column['dtype']).tobytes())
+                rows[name] = [column['rows'], column['rows'] + len(array)]
+                column['rows'] += len(array)
+            runs.append({'rows': rows, 'layout': result.layout, 'traits': result.traits, 'meta': result.meta})
+    finally:
+        for f in files.values():
+            f.close()
+    tmp = os.path.join(path, 'meta.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump({'columns': columns, 'runs': runs}, f)
+    os.replace(tmp, os.path.join(path, 'meta.json'))
+
+
+# a directory written by write_runs, memory-mapped; runs come out as RunResults whose
+# arrays are views into the mapped columns
+class RunDataset:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.runs = meta['runs']
+        self.columns = {}
+        for name, column in meta['columns'].items():
+            shape = (column['rows'],) + tuple(column['shape'])
+            if column['rows'] and all(shape):
+                self.columns[name] = np.memmap(os.path.join(path, name + '.bin'), dtype=column['dtype'], mode='r', shape=shape)
+            else:
+                self.columns[name] = np.zeros(shape, dtype=column['dtype'])
+
+    def __len__(self):
+        return len(self.runs)
+
+    def __getitem__(self, i):
+        run = self.runs[i]
+        arrays = {name: self.columns[name][start:stop] for name, (start, stop) in run['rows'].items()}
+        return RunResult(arrays, run['layout'], run['traits'], run['meta'])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    # every run's rows of one column back to back, and where each run's rows start
+    # (len(self) + 1 entries); runs without the column get no rows
+    def column(self, name):
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        for i, run in enumerate(self.runs):
+            offsets[i + 1] = run['rows'][name][1] if name in run['rows'] else offsets[i]
+        return self.columns[name], offsets
+
+    # run metadata as a list of dicts, in run order
+    def meta(self):
+        return [run['meta'] for run in self.runs]
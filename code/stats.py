@@ -0,0 +1,200 @@
+import math
+from collections import namedtuple
+import numpy as np
+
+# ONLINE STATISTICS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Running aggregates that never keep the samples they have seen.
+
+# element-wise mean / variance / min / max over many series (one value per
+# generation), using Welford's update. Series of different lengths are aligned
+# at generation 0, so every generation keeps its own sample count.
+class SeriesStats:
+    def __init__(self):
+        self.count = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.min = np.zeros(0)
+        self.max = np.zeros(0)
+
+    def __len__(self):
+        return len(self.count)
+
+    def _grow(self, length):
+        extra = length - len(self.count)
+        if extra <= 0:
+            return
+        self.count = np.r_[self.count, np.zeros(extra)]
+        self.mean = np.r_[self.mean, np.zeros(extra)]
+        self.m2 = np.r_[self.m2, np.zeros(extra)]
+        self.min = np.r_[self.min, np.full(extra, np.inf)]
+        self.max = np.r_[self.max, np.full(extra, -np.inf)]
+
+    def add(self, series):
+        values = np.asarray(series, dtype=np.float64).ravel()
+        k = len(values)
+        self._grow(k)
+        self.count[:k] += 1
+        delta = values - self.mean[:k]
+        self.mean[:k] += delta / self.count[:k]
+        self.m2[:k] += delta * (values - self.mean[:k])
+        self.min[:k] = np.minimum(self.min[:k], values)
+        self.max[:k] = np.maximum(self.max[:k], values)
+
+    # sample variance, 0 where fewer than two series reached that generation
+    def variance(self):
+        out = np.zeros(len(self.count))
+        many = self.count > 1
+        out[many] = self.m2[many] / (self.count[many] - 1)
+        return out
+
+    def std(self):
+        return np.sqrt(self.variance())
+
+    # normal-approximation confidence interval for the mean, z=1.96 gives 95%
+    def interval(self, z=1.96):
+        half = z * np.sqrt(self.variance() / np.maximum(self.count, 1))
+        return self.mean - half, self.mean + half
+
+
+# mean / variance / min / max of a stream of single values; the mean is the running
+# sum over the count, as sum(values) / len(values) would give, and Welford's update
+# is only kept for the variance, which is over everything seen (ddof=0)
+class RunningStats:
+    __slots__ = ('count', 'total', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.mean = 0.0 # Welford's running mean, which m2 is centred on
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    # fold in a whole array at once (Chan et al.'s pairwise update)
+    def add_array(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values):
+            total = values.sum().item()
+            self._merge(len(values), total, ((values - total / len(values)) ** 2).sum().item(), values.min().item(), values.max().item())
+
+    # fold in values[i] seen counts[i] times, for populations kept as counts
+    def add_counts(self, values, counts):
+        values = np.asarray(values, dtype=np.float64)
+        counts = np.asarray(counts, dtype=np.int64)
+        seen = values[counts > 0]
+        n = counts.sum().item()
+        if n:
+            total = (values * counts).sum().item()
+            self._merge(n, total, (counts * (values - total / n) ** 2).sum().item(), seen.min().item(), seen.max().item())
+
+    # n more values with the given sum, sum of squared deviations from their mean, min and max
+    def _merge(self, n, total, m2, low, high):
+        count = self.count + n
+        delta = total / n - self.mean
+        self.mean += delta * n / count
+        self.m2 += m2 + delta * delta * self.count * n / count
+        self.count = count
+        self.total += total
+        self.min = min(self.min, low)
+        self.max = max(self.max, high)
+
+    def variance(self):
+        return self.m2 / self.count if self.count else 0.0
+
+    # all zeros when nothing was seen, like the averages of an extinct generation
+    def summary(self):
+        if self.count == 0:
+            return TraitSummary(0, 0, 0, 0)
+        return TraitSummary(self.total / self.count, self.variance(), self.min, self.max)
+
+
+TraitSummary = namedtuple('TraitSummary', ['mean', 'variance', 'min', 'max'])
+
+# one generation of a run: its index (from 0), the survivors it ended with, the food
+# they left, summaries of the survivors' traits, and the population the next
+# generation starts with; predators is only filled in by predator_extension
+GenerationRecord = namedtuple('GenerationRecord', ['generation', 'survivors', 'remaining_food', 'energy', 'speed', 'size', 'population', 'predators'], defaults=(None,))
+
+
+# what the drivers read from an environment, for every engine that keeps agent_counts,
+# remaining_food, the avg_* lists, the *_dist histograms and the survivors' *_stats of
+# its last generation
+class GenerationSeries:
+    # summary of the generation the last step() ran
+    def record(self):
+        return GenerationRecord(len(self.remaining_food) - 1, self.energy_stats.count, self.remaining_food[-1], self.energy_stats.summary(), self.speed_stats.summary(), self.size_stats.summary(), self.agent_counts[-1])
+
+    # progress lines run_generations prints before generation i with verbose on
+    def progress(self, i):
+        return ["Total Population: " + str(self.agent_counts[i])]
+
+    # the per-generation lists simulate() returns
+    def series(self):
+        return (self.agent_counts, self.avg_energy, self.avg_speed, self.avg_size, self.speed_dist, self.size_dist)
+
+
+# per-generation histogram of a trait over fixed bin edges; values outside the
+# edges are counted in the first / last bin. Only the latest generation's raw
+# values are kept (in .last).
+class TraitHistogram:
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = []
+        self.last = np.zeros(0)
+
+    def __len__(self):
+        return len(self.counts)
+
+    # weights, when given, is how many individuals each value stands for; .last then
+    # repeats every value that many times
+    def add(self, values, weights=None):
+        values = np.array(values, dtype=np.float64)
+        inner = np.clip(values, self.edges[0], self.edges[-1])
+        counts, _ = np.histogram(inner, self.edges, weights=weights)
+        self.counts.append(counts.astype(np.int32))
+        self.last = values if weights is None else np.repeat(values, weights)
+
+    # generations x bins
+    def as_array(self):
+        return np.array(self.counts).reshape(len(self.counts), len(self.edges) - 1)
+
+    # (left edges, widths, counts) of the bins between the first and last non-empty one
+    def occupied(self, generation=-1):
+        counts = self.counts[generation]
+        used = np.flatnonzero(counts)
+        if len(used) == 0:
+            return self.edges[:0], self.edges[:0], counts[:0]
+        span = slice(used[0], used[-1] + 1)
+        return self.edges[:-1][span], np.diff(self.edges)[span], counts[span]
+
+    # q-th quantile of a generation; exact for the latest one, otherwise interpolated
+    # within the bin it falls in
+    def quantile(self, q, generation=-1):
+        if generation in (-1, len(self.counts) - 1) and len(self.last):
+            return float(np.quantile(self.last, q))
+        counts = self.counts[generation]
+        total = counts.sum()
+        if total == 0:
+            return 0.0
+        cumulative = np.cumsum(counts)
+        k = min(int(np.searchsorted(cumulative, q * total)), len(counts) - 1)
+        before = cumulative[k] - counts[k]
+        frac = (q * total - before) / counts[k] if counts[k] else 0.0
+        return float(self.edges[k] + frac * (self.edges[k + 1] - self.edges[k]))
+
+
+# speeds are whole numbers, one bin each from 0 to 63 (faster agents land in the last bin)
+SPEED_BINS = np.arange(65) - 0.5
+# sizes change by factors, so they get 16 log-spaced bins per decade from 0.1 to 1000
+SIZE_BINS = np.geomspace(0.1, 1000, 65)
@@ -0,0 +1,69 @@
+import numpy as np
+from stats import TraitHistogram
+
+# EARLY STOPPING ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Rules for ending a run before `iterations`, checked by run_generations after
+# every generation (simulate(..., stop=StopCriteria(...))):
+#   extinction       no agent of any species is left for the next generation
+#   max_population   the next generation has at least this many agents
+#   window           steady state: over the last `window` generations agent_counts,
+#                    avg_speed and avg_size each stayed within `tolerance` of their
+#                    mean (relative spread, (max - min) / |mean|)
+# env.stop_reason says which rule fired: 'extinction', 'max_population',
+# 'steady_state', or None when the run went the full length.
+#
+# What simulate() returns after an early stop:
+#   pad=False   the series stop where the run stopped: one entry per generation run
+#               (agent_counts and pred_counts one more, for the starting population)
+#   pad=True    the series have the length of a full run. After an extinction the
+#               padding is exactly what the remaining generations would have produced:
+#               0 agents, 0.0 averages and empty histogram rows. After the other rules
+#               the last generation's values (and histogram row) are repeated.
+
+
+class StopCriteria:
+    def __init__(self, extinction=True, max_population=None, window=None, tolerance=0.01, pad=False):
+        self.extinction = extinction
+        self.max_population = max_population
+        self.window = window
+        self.tolerance = tolerance
+        self.pad = pad
+
+    # the rule env meets after its last generation, None to carry on
+    def reason(self, env):
+        counts = env.agent_counts
+        if self.extinction and all(c[-1] == 0 for c in getattr(env, 'counts', {None: counts}).values()):
+            return 'extinction'
+        if self.max_population is not None and counts[-1] >= self.max_population:
+            return 'max_population'
+        if self.window and len(env.avg_speed) >= self.window:
+            if all(self.steady(series[-self.window:]) for series in (counts, env.avg_speed, env.avg_size)):
+                return 'steady_state'
+        return None
+
+    def steady(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        return values.max() - values.min() <= self.tolerance * abs(values.mean())
+
+    # the simulate() tuple of env's run, padded to a full run of iterations if pad is set
+    def finish(self, result, env, iterations):
+        missing = iterations - len(env.remaining_food)
+        if not self.pad or env.stop_reason is None or missing <= 0:
+            return result
+        return pad_result(result, missing, env.stop_reason == 'extinction')
+
+
+# result with `missing` more generations: zeros when extinct, else repeats of the last one
+def pad_result(result, missing, extinct):
+    padded = []
+    for series in result:
+        if isinstance(series, TraitHistogram):
+            histogram = TraitHistogram(series.edges)
+            row = np.zeros_like(series.counts[-1]) if extinct else series.counts[-1]
+            histogram.counts = series.counts + [row.copy() for _ in range(missing)]
+            histogram.last = series.last
+            padded.append(histogram)
+        else:
+            fill = (0 if isinstance(series[-1], int) else 0.0) if extinct else series[-1]
+            padded.append(list(series) + [fill] * missing)
+    return tuple(padded)
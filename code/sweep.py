@@ -0,0 +1,97 @@
+import itertools
+import os
+import random
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from natural_selection import simulate, SPEED_BOOST, SIZE_BOOST
+from stats import SeriesStats
+
+# PARAMETER SWEEPS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Runs simulate() for every combination of configuration and mutation tables,
+# several times each, across a process pool.
+#
+# grid: iterable of (x, y, iterations, num_agents, num_food) tuples
+# speed_boosts / size_boosts: lists of mutation tables, defaulting to the ones
+# in natural_selection
+#
+# Every replicate gets its own seed derived from (seed, configuration, tables,
+# replicate), so a run gives the same result whichever worker picks it up and
+# however many workers there are.
+#
+# stop (a StopCriteria, code/stopping.py) ends runs whose population died out or
+# settled, so the compute goes to the runs that are still changing. With pad=True
+# every run still gives full-length series; truncated runs shorten the later
+# generations of summarize()'s statistics to the runs that got that far.
+
+# series returned by simulate() that are kept for each run, as NumPy arrays
+SERIES = ('agent_counts', 'avg_energy', 'avg_speed', 'avg_size')
+
+# key identifies the (configuration, speed table, size table) combination
+SweepRun = namedtuple('SweepRun', ['key', 'replicate', 'seed', 'series'])
+
+
+def table_key(table):
+    return tuple(sorted(table.items()))
+
+
+def make_tasks(grid, replicates, speed_boosts, size_boosts, seed, engine, stop):
+    for c, config in enumerate(grid):
+        for s, speed_boost in enumerate(speed_boosts):
+            for z, size_boost in enumerate(size_boosts):
+                key = (tuple(config), table_key(speed_boost), table_key(size_boost))
+                for r in range(replicates):
+                    run_seed = int(np.random.SeedSequence(seed, spawn_key=(c, s, z, r)).generate_state(1)[0])
+                    yield key, r, run_seed, tuple(config), speed_boost, size_boost, engine, stop
+
+
+# runs in the worker process
+def run_task(task):
+    key, replicate, run_seed, config, speed_boost, size_boost, engine, stop = task
+    random.seed(run_seed)
+    result = simulate(*config, engine=engine, speed_boost=speed_boost, size_boost=size_boost, stop=stop)
+    agent_counts, avg_energy, avg_speed, avg_size, speed_dist, size_dist = result
+    # typed arrays pickle back to the parent far faster than lists
+    series = {name: np.array(values, dtype=np.int64 if name == 'agent_counts' else np.float64) for name, values in zip(SERIES, (agent_counts, avg_energy, avg_speed, avg_size))}
+    return SweepRun(key, replicate, run_seed, series)
+
+
+# yields a SweepRun as each run finishes, in completion order
+# at most 2 * workers runs are queued at once, so huge sweeps are never materialised
+def run_sweep(grid, replicates=1, speed_boosts=None, size_boosts=None, seed=0, workers=None, engine='object', stop=None):
+    speed_boosts = [SPEED_BOOST] if speed_boosts is None else speed_boosts
+    size_boosts = [SIZE_BOOST] if size_boosts is None else size_boosts
+    workers = workers or os.cpu_count() or 1
+    tasks = make_tasks(grid, replicates, speed_boosts, size_boosts, seed, engine, stop)
+
+    pool = ProcessPoolExecutor(workers)
+    try:
+        pending = set(pool.submit(run_task, task) for task in itertools.islice(tasks, 2 * workers))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for task in itertools.islice(tasks, 1):
+                    pending.add(pool.submit(run_task, task))
+                yield future.result()
+    finally:
+        # also reached when the caller stops iterating early
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+# folds a stream of runs into {key: {series name: SeriesStats}} without keeping the runs
+def summarize(runs, series=('agent_counts', 'avg_speed', 'avg_size')):
+    summary = {}
+    for run in runs:
+        stats = summary.setdefault(run.key, {name: SeriesStats() for name in series})
+        for name in series:
+            stats[name].add(run.series[name])
+    return summary
+
+
+if __name__ == '__main__':
+    # food surplus vs food scarcity, 8 replicates each
+    grid = [(50, 50, 20, 50, 100), (50, 50, 20, 50, 25)]
+    summary = summarize(run_sweep(grid, replicates=8))
+    for key, stats in summary.items():
+        low, high = stats['agent_counts'].interval()
+        print(key[0], 'final population %.1f (95%% CI %.1f - %.1f)' % (stats['agent_counts'].mean[-1], low[-1], high[-1]))
@@ -0,0 +1,31 @@
+import random
+from natural_selection import Environment
+
+# CAPPED GENOTYPE POPULATIONS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# a 'genotypes' generation spawns at most max_agents agents, and the individuals
+# left out are settled from their counts
+
+def run(generations, **options):
+    random.seed(3)
+    env = Environment(20, 20, 30, 0, population='genotypes', backend='python', **options)
+    spawned = []
+    for _ in range(generations):
+        uid = env.next_uid
+        env.step()
+        spawned.append(env.next_uid - uid)
+    return env, spawned
+
+
+def test_spawns_at_most_max_agents():
+    env, spawned = run(6, max_agents=50)
+    assert spawned[1:] == [50] * 5
+    assert env.agent_counts == [30 * 2 ** k for k in range(7)]
+
+
+# without food every individual stands still and survives, so the crowd's settlement is exact
+def test_crowd_matches_spawned_agents_without_food():
+    capped, _ = run(5, max_agents=10)
+    uncapped, _ = run(5, max_agents=10 ** 9)
+    assert capped.agent_counts == uncapped.agent_counts
+    assert capped.avg_energy == uncapped.avg_energy
+    assert capped.remaining_food == uncapped.remaining_food
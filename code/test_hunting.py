@@ -0,0 +1,50 @@
+import random
+import predator_extension
+from food_store import FoodStore
+
+# HUNTING UNDER 'arrival' CONTENTION ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# a prey that claims food and is eaten in the same pass uses the food up, as with
+# 'sequential' contention, but must stay eaten
+
+def make_environment():
+    random.seed(1)
+    env = predator_extension.Environment(10, 10, 0, 0, contention='arrival')
+    food = [(5, 5)]
+    env.food_grid = FoodStore(food)
+    env.food_index = env.food_index_type(food, env.width, env.height, env.counters)
+    return env
+
+
+def test_eaten_prey_loses_its_claim():
+    env = make_environment()
+    prey = env.spawn(4, 5, 'prey')
+    predator = env.spawn(5, 5, 'predator')
+    env.populations['prey'] = [prey]
+    env.populations['predator'] = [predator]
+    env.run_ticks()
+    assert prey.energy <= 0
+    assert len(env.food_grid) == 0
+    env.kill_the_weak()
+    assert env.agents == []
+
+
+# a whole movement phase: every hunted prey ends it out of energy, and resolve_claims
+# feeds none of them, including those that claimed food before they were caught
+def test_arrival_runs_with_predators():
+    random.seed(9)
+    env = predator_extension.Environment(20, 20, 40, 60, contention='arrival')
+    env.populate_food()
+    paid = []
+    resolve_claims = env.resolve_claims
+
+    def watched_resolve_claims():
+        eaten = [(agent, agent.energy) for claimants in env.claims.values() for agent in claimants if agent.eaten]
+        resolve_claims()
+        paid.extend(agent.energy - energy for agent, energy in eaten)
+
+    env.resolve_claims = watched_resolve_claims
+    env.run_ticks()
+    eaten = [prey for prey in env.agents if prey.eaten]
+    assert eaten and paid
+    assert all(prey.energy <= 0 for prey in eaten)
+    assert paid == [0] * len(paid)
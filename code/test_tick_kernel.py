@@ -0,0 +1,8 @@
+from tick_kernel import check_backends
+
+# KERNEL AGAINST THE OBJECT PATH ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# the same seeded runs on backend='python' and backend='kernel', with both food
+# indexes; compiled when numba is installed, interpreted otherwise
+
+def test_kernel_matches_python():
+    assert check_backends() == []
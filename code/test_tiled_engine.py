@@ -0,0 +1,19 @@
+import array_engine
+import tiled_engine
+
+# EMPTY POPULATION OR NO FOOD ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# the tiled engine must run what the array engine runs, with nothing to put in
+# one of its shared memory blocks
+
+def check_matches_array_engine(num_agents, num_food):
+    tiled = tiled_engine.simulate(30, 30, 2, num_agents, num_food, seed=1, workers=1)
+    array = array_engine.simulate(30, 30, 2, num_agents, num_food, seed=1)
+    assert tiled[:4] == array[:4]
+
+
+def test_no_food():
+    check_matches_array_engine(10, 0)
+
+
+def test_no_agents():
+    check_matches_array_engine(0, 10)
@@ -0,0 +1,289 @@
+import importlib.util
+import math
+import numpy as np
+from food_index import GridFoodIndex
+
+# TICK KERNEL ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# One pass of Environment.run_ticks over plain arrays: target lookup, the
+# axis-greedy walk of shortest_path_step, energy and food, for every active
+# agent in order. With numba installed the pass is compiled with njit (cached on
+# disk, so only the first run on a machine pays for compiling); without it the
+# same function runs as plain Python, which is only useful for checking it.
+#
+# Food lives in the bucket grid of GridFoodIndex, as arrays sized by the food count:
+# the same cell size, the same ring-by-ring search and the same rebuilds once most of
+# the food is gone. With food_index='linear' the kernel scans all the food instead.
+#
+# It covers the 'tick' scheduler with 'sequential' contention and no hunting or
+# recorder, and gives the same survivors, energies, positions and counters as the
+# object path with the same food index.
+# Environment(backend='auto') picks it whenever numba is installed and the
+# settings allow, backend='python' always walks Agent objects.
+#
+#   python tick_kernel.py     compares both backends on fixed seeds
+
+HAVE_NUMBA = importlib.util.find_spec('numba') is not None
+
+# slots of the counters array
+NEAREST_QUERIES, CACHED_TARGETS, DISTANCE_EVALS, PATH_STEPS = range(4)
+# slots of the grid array: the bucket grid's shape and bounds, the food left in it, and
+# its settings (map size, food per bucket, 1 for a linear scan)
+CELL, COLUMNS, ROWS, MIN_CX, MAX_CX, MIN_CY, MAX_CY, SIZE, REBUILD_AT, WIDTH, HEIGHT, PER_CELL, LINEAR = range(13)
+
+compiled = None
+
+
+# bucket side for size pieces of food, as GridFoodIndex._build works it out
+def cell_size(width, height, size, per_cell):
+    return max(1, math.ceil(math.sqrt(per_cell * (width + 1) * (height + 1) / max(size, 1))))
+
+
+# (re)fills the bucket grid with the uneaten food: bucket b = cx * rows + cy holds the
+# ranks bucket_items[bucket_start[b]:bucket_start[b + 1]], lowest first
+def build_grid(food_x, food_y, alive, grid, bucket_start, bucket_items):
+    size = 0
+    for f in range(alive.shape[0]):
+        if alive[f]:
+            size += 1
+    cell = max(1, math.ceil(math.sqrt(grid[PER_CELL] * (grid[WIDTH] + 1) * (grid[HEIGHT] + 1) / max(size, 1))))
+    columns = grid[WIDTH] // cell + 1
+    rows = grid[HEIGHT] // cell + 1
+    grid[CELL] = cell
+    grid[COLUMNS] = columns
+    grid[ROWS] = rows
+    grid[SIZE] = size
+    grid[REBUILD_AT] = size // 4
+    grid[MIN_CX] = columns
+    grid[MAX_CX] = -1
+    grid[MIN_CY] = rows
+    grid[MAX_CY] = -1
+    bucket_start[:columns * rows + 1] = 0
+    for f in range(alive.shape[0]):
+        if alive[f]:
+            cx = food_x[f] // cell
+            cy = food_y[f] // cell
+            bucket_start[cx * rows + cy + 1] += 1
+            grid[MIN_CX] = min(grid[MIN_CX], cx)
+            grid[MAX_CX] = max(grid[MAX_CX], cx)
+            grid[MIN_CY] = min(grid[MIN_CY], cy)
+            grid[MAX_CY] = max(grid[MAX_CY], cy)
+    for b in range(columns * rows):
+        bucket_start[b + 1] += bucket_start[b]
+    filled = bucket_start[:columns * rows].copy()
+    for f in range(alive.shape[0]):
+        if alive[f]:
+            b = (food_x[f] // cell) * rows + food_y[f] // cell
+            bucket_items[filled[b]] = f
+            filled[b] += 1
+
+
+# runs the agents order[start:] of a pass; returns where to carry on once the grid wants
+# rebuilding after a piece of food was eaten, or order.shape[0] at the end of the pass
+def tick(order, start, x, y, energy, speed, movement_cost, food_reward, stationary_penalty, satiated, target,
+         food_x, food_y, alive, grid, bucket_start, bucket_items, counters):
+    for k in range(start, order.shape[0]):
+        i = order[k]
+        # closest food: the agent's target while it is uneaten, otherwise a lookup that
+        # keeps the lowest rank of equally close pieces
+        t = target[i]
+        if t >= 0 and alive[t]:
+            dist = abs(x[i] - food_x[t]) + abs(y[i] - food_y[t])
+            counters[CACHED_TARGETS] += 1
+            counters[DISTANCE_EVALS] += 1
+        else:
+            t = -1
+            dist = 0
+            if grid[LINEAR]:
+                for f in range(food_x.shape[0]):
+                    if alive[f]:
+                        counters[DISTANCE_EVALS] += 1
+                        d = abs(x[i] - food_x[f]) + abs(y[i] - food_y[f])
+                        if t < 0 or d < dist:
+                            t = f
+                            dist = d
+            elif grid[SIZE] > 0:
+                # rings of buckets outwards from the agent's, as GridFoodIndex.nearest
+                cell = grid[CELL]
+                rows = grid[ROWS]
+                cx = x[i] // cell
+                cy = y[i] // cell
+                max_ring = max(cx - grid[MIN_CX], grid[MAX_CX] - cx, cy - grid[MIN_CY], grid[MAX_CY] - cy)
+                ring = 0
+                while ring <= max_ring:
+                    for kx in range(cx - ring, cx + ring + 1):
+                        if kx < 0 or kx >= grid[COLUMNS]:
+                            continue
+                        # the whole column on the ring's sides, its two ends in between
+                        step = 1 if kx == cx - ring or kx == cx + ring else 2 * ring
+                        for ky in range(cy - ring, cy + ring + 1, step):
+                            if ky < 0 or ky >= rows:
+                                continue
+                            b = kx * rows + ky
+                            for j in range(bucket_start[b], bucket_start[b + 1]):
+                                f = bucket_items[j]
+                                if alive[f]:
+                                    counters[DISTANCE_EVALS] += 1
+                                    d = abs(x[i] - food_x[f]) + abs(y[i] - food_y[f])
+                                    if t < 0 or d < dist or (d == dist and f < t):
+                                        t = f
+                                        dist = d
+                    # every bucket of the next ring is at least ring * cell + 1 away
+                    if t >= 0 and dist <= ring * cell:
+                        break
+                    ring += 1
+            counters[NEAREST_QUERIES] += 1
+
+        if t < 0 or dist >= energy[i] * speed[i]:
+            target[i] = -1
+            energy[i] -= stationary_penalty[i]
+            satiated[i] = True
+            continue
+
+        # walk towards the food, longer axis first
+        target[i] = t
+        steps = 0
+        while steps < speed[i] and (x[i] != food_x[t] or y[i] != food_y[t]):
+            x_delta = food_x[t] - x[i]
+            y_delta = food_y[t] - y[i]
+            if abs(y_delta) > abs(x_delta):
+                y[i] += 1 if y_delta > 0 else -1
+            else:
+                x[i] += 1 if x_delta > 0 else -1
+            energy[i] -= movement_cost[i]
+            steps += 1
+        counters[PATH_STEPS] += steps
+
+        # eat the lowest-ranked food on the cell it ends up on
+        cell = grid[CELL]
+        kx = x[i] // cell
+        ky = y[i] // cell
+        if 0 <= kx < grid[COLUMNS] and 0 <= ky < grid[ROWS]:
+            b = kx * grid[ROWS] + ky
+            for j in range(bucket_start[b], bucket_start[b + 1]):
+                f = bucket_items[j]
+                if alive[f] and food_x[f] == x[i] and food_y[f] == y[i]:
+                    alive[f] = False
+                    energy[i] += food_reward[i]
+                    grid[SIZE] -= 1
+                    if grid[SIZE] < grid[REBUILD_AT]:
+                        return k + 1
+                    break
+    return order.shape[0]
+
+
+# (tick, build_grid), compiled with numba when it is installed, else the plain functions
+def get_kernels():
+    global compiled
+    if not HAVE_NUMBA:
+        return tick, build_grid
+    if compiled is None:
+        from numba import njit
+        compiled = njit(cache=True)(tick), njit(cache=True)(build_grid)
+    return compiled
+
+
+# the movement phase of env's generation on the kernel, with the agents and the food
+# written back afterwards; returns the number of passes
+def run_ticks(env):
+    tick, build_grid = get_kernels()
+    movers = env.movers()
+    n = len(movers)
+    x = np.array([agent.x for agent in movers], dtype=np.int64)
+    y = np.array([agent.y for agent in movers], dtype=np.int64)
+    speed = np.array([agent.speed for agent in movers])
+    costs = [np.array([getattr(agent, name) for agent in movers]) for name in ('energy', 'movement_cost', 'food_reward', 'stationary_penalty')]
+    # integer energies stay integers, as they do on Agent objects
+    dtype = np.result_type(*costs, np.int64)
+    energy, movement_cost, food_reward, stationary_penalty = [column.astype(dtype) for column in costs]
+    if speed.dtype.kind != 'f':
+        speed = speed.astype(np.int64)
+    satiated = np.zeros(n, dtype=bool)
+    target = np.full(n, -1, dtype=np.int64)
+
+    # food columns in rank order, bucketed like the grid index; the first build has the
+    # smallest buckets, so the most of them
+    num_food = len(env.food_grid)
+    food_x = np.zeros(num_food, dtype=np.int64)
+    food_y = np.zeros(num_food, dtype=np.int64)
+    alive = np.zeros(num_food, dtype=bool)
+    for pos, ranks in env.food_grid.cells.items():
+        for rank in ranks:
+            food_x[rank], food_y[rank] = pos
+            alive[rank] = True
+    grid = np.zeros(13, dtype=np.int64)
+    grid[WIDTH] = env.width
+    grid[HEIGHT] = env.height
+    grid[LINEAR] = not isinstance(env.food_index, GridFoodIndex)
+    grid[PER_CELL] = 2 if grid[LINEAR] else env.food_index.per_cell
+    cell = cell_size(env.width, env.height, num_food, grid[PER_CELL])
+    bucket_start = np.zeros((env.width // cell + 1) * (env.height // cell + 1) + 1, dtype=np.int64)
+    bucket_items = np.zeros(num_food, dtype=np.int64)
+    build_grid(food_x, food_y, alive, grid, bucket_start, bucket_items)
+    counters = np.zeros(4, dtype=np.int64)
+
+    order = np.arange(n, dtype=np.int64)
+    satiated_at = np.zeros(n, dtype=np.int64)
+    passes = 0
+    while len(order):
+        start = 0
+        while start < len(order):
+            start = tick(order, start, x, y, energy, speed, movement_cost, food_reward, stationary_penalty, satiated, target,
+                         food_x, food_y, alive, grid, bucket_start, bucket_items, counters)
+            if start < len(order):
+                build_grid(food_x, food_y, alive, grid, bucket_start, bucket_items)
+        done = satiated[order]
+        satiated_at[order[done]] = passes
+        order = order[~done]
+        passes += 1
+
+    # retired agents stood still for the rest of the generation
+    if env.penalty == 'per_pass':
+        energy -= stationary_penalty * (passes - 1 - satiated_at)
+
+    for rank in np.flatnonzero(~alive).tolist():
+        env.consume((int(food_x[rank]), int(food_y[rank])))
+    for agent, agent_x, agent_y, agent_energy, agent_target in zip(movers, x.tolist(), y.tolist(), energy.tolist(), target.tolist()):
+        agent.x = agent_x
+        agent.y = agent_y
+        agent.energy = agent_energy
+        agent.satiated = True
+        agent.target = (int(food_x[agent_target]), int(food_y[agent_target])) if agent_target >= 0 else None
+    for name, slot in (('nearest_queries', NEAREST_QUERIES), ('cached_targets', CACHED_TARGETS), ('distance_evals', DISTANCE_EVALS), ('path_steps', PATH_STEPS)):
+        env.counters[name] += int(counters[slot])
+    return passes
+
+
+# runs natural_selection with backend='python' and backend='kernel' on the same seeds,
+# with both food indexes, and returns a description of every difference, an empty list
+# when they agree
+def check_backends(seeds=(1, 2, 3), generations=6, width=60, height=60, num_agents=60, num_food=150, **options):
+    import random
+    from natural_selection import Environment
+    differences = []
+    for food_index in ('linear', 'grid'):
+        for seed in seeds:
+            runs = {}
+            for backend in ('python', 'kernel'):
+                random.seed(seed)
+                env = Environment(width, height, num_agents, num_food, food_index=food_index, backend=backend, **options)
+                for _ in range(generations):
+                    env.step()
+                runs[backend] = env
+            reference, kernel = runs['python'], runs['kernel']
+            for name in ('agent_counts', 'remaining_food', 'avg_energy', 'avg_speed', 'avg_size', 'counters'):
+                if getattr(reference, name) != getattr(kernel, name):
+                    differences.append('%s, seed %d: %s %s != %s' % (food_index, seed, name, getattr(reference, name), getattr(kernel, name)))
+            columns = [[(agent.uid, agent.x, agent.y, agent.energy, agent.speed, agent.size) for agent in env.agents] for env in (reference, kernel)]
+            if columns[0] != columns[1]:
+                differences.append('%s, seed %d: agents differ' % (food_index, seed))
+    return differences
+
+
+if __name__ == '__main__':
+    import sys
+    print('backend:', 'numba' if HAVE_NUMBA else 'plain Python (numba is not installed)')
+    differences = check_backends()
+    for difference in differences:
+        print(difference)
+    print('kernel matches the reference' if not differences else '%d differences' % len(differences))
+    sys.exit(1 if differences else 0)
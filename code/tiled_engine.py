@@ -0,0 +1,221 @@
+import os
+import time
+from multiprocessing import Pool, resource_tracker, shared_memory
+import numpy as np
+from array_engine import ArrayEnvironment, nearest_visible_food
+from natural_selection import run_simulation
+
+# TILED ENGINE ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# ArrayEnvironment with the map cut into a grid of tiles that a pool of worker
+# processes share out. The expensive part of a tick, every pending agent looking
+# for its closest visible food, is done tile by tile; claims on food, moves and
+# energy stay in the parent, as in ArrayEnvironment.tick.
+#
+# During the movement phase, agent positions, the pending agents and the food
+# (with the visibility limits of ArrayEnvironment.tick) live in shared memory.
+# Every round a tile takes the pending agents standing on it, so an agent that
+# walked onto another tile is handed over to that tile. A tile searches the food
+# on it and in a halo of `halo` cells around it; an agent whose closest food there
+# is not nearer than the edge of the halo searches all the food instead, so food
+# across a tile border is found exactly as without tiles. Food that agents from
+# several tiles go for is handed out by the parent's claim step, one piece per
+# agent in population order, as before.
+#
+# Runs are identical to ArrayEnvironment with the same seed, for any tiling and any
+# number of workers.
+
+AGENT_COLUMNS = (('x', np.int64), ('y', np.int64), ('pending', np.int64))
+FOOD_COLUMNS = (('x', np.int64), ('y', np.int64), ('until', np.int64))
+
+
+# {name: array} views of the first n of capacity rows, one column after the other
+def column_views(buffer, columns, capacity, n):
+    views = {}
+    offset = 0
+    for name, dtype in columns:
+        views[name] = np.ndarray(n, dtype=dtype, buffer=buffer, offset=offset)
+        offset += capacity * np.dtype(dtype).itemsize
+    return views
+
+
+# named columns in one shared memory block, replaced by a bigger one when they outgrow it
+class SharedColumns:
+    def __init__(self, columns):
+        self.columns = columns
+        self.shm = None
+        self.capacity = 0
+
+    # views of the first n rows, with the columns in values ({name: array}) filled in
+    # from the top; growing the block drops what was in it, and a block is made even
+    # for no rows, so an empty population or no food still has one to point workers at
+    def fill(self, n, values):
+        if self.shm is None or n > self.capacity:
+            self.close()
+            self.capacity = max(n, 2 * self.capacity)
+            size = sum(np.dtype(dtype).itemsize for _, dtype in self.columns) * self.capacity
+            self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        views = column_views(self.shm.buf, self.columns, self.capacity, n)
+        for name, array in values.items():
+            views[name][:len(array)] = array
+        return views
+
+    # what a worker needs to find the same views
+    def spec(self, n):
+        return self.shm.name, self.capacity, n
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+# shared blocks this process has opened, by name
+attached = {}
+
+
+def attach(spec, columns):
+    name, capacity, n = spec
+    if name not in attached:
+        attached[name] = shared_memory.SharedMemory(name=name)
+    return column_views(attached[name].buf, columns, capacity, n)
+
+
+# closes the blocks the parent has since replaced
+def detach(keep):
+    for name in [name for name in attached if name not in keep]:
+        attached.pop(name).close()
+
+
+# one round of one tile, run in a worker: the closest visible food for the first count
+# pending agents that stand on the tile, as (places in the pending list, targets, distances)
+def tile_nearest(task):
+    bounds, halo, width, height, count, agent_spec, food_spec = task
+    detach((agent_spec[0], food_spec[0]))
+    agents = attach(agent_spec, AGENT_COLUMNS)
+    food = attach(food_spec, FOOD_COLUMNS)
+    x0, x1, y0, y1 = bounds
+    pending = agents['pending'][:count]
+    x, y = agents['x'][pending], agents['y'][pending]
+    mine = np.flatnonzero((x >= x0) & (x < x1) & (y >= y0) & (y < y1))
+    idx = pending[mine]
+    far = np.iinfo(np.int64).max
+    live = np.flatnonzero(food['until'] > 0)
+
+    # the food on the tile and in its halo first
+    hx0, hx1, hy0, hy1 = x0 - halo, x1 - 1 + halo, y0 - halo, y1 - 1 + halo
+    fx, fy = food['x'][live], food['y'][live]
+    near = live[(fx >= hx0) & (fx <= hx1) & (fy >= hy0) & (fy <= hy1)]
+    target, dist = nearest_visible_food(agents['x'], agents['y'], food['x'], food['y'], food['until'], idx, near)
+    # food beyond the halo is at least this far away (there is none off the map), agents
+    # that found nothing closer look at all of it
+    margin = np.full(len(idx), far, dtype=np.int64)
+    ax, ay = x[mine], y[mine]
+    for edge, gap in ((hx0 > 0, ax - hx0 + 1), (hx1 < width, hx1 - ax + 1), (hy0 > 0, ay - hy0 + 1), (hy1 < height, hy1 - ay + 1)):
+        if edge:
+            margin = np.minimum(margin, gap)
+    unsure = np.flatnonzero(dist >= margin)
+    if len(unsure):
+        target[unsure], dist[unsure] = nearest_visible_food(agents['x'], agents['y'], food['x'], food['y'], food['until'], idx[unsure], live)
+    return mine, target, dist
+
+
+# tile edges along an axis of size cells cut into parts
+def tile_edges(size, parts):
+    return np.linspace(0, size, parts + 1).round().astype(np.int64).tolist()
+
+
+# (x0, x1, y0, y1) of each tile, upper bounds excluded, covering cells 0..width x 0..height
+def tile_bounds(width, height, tiles):
+    xs = tile_edges(width + 1, tiles[0])
+    ys = tile_edges(height + 1, tiles[1])
+    return [(xs[i], xs[i + 1], ys[j], ys[j + 1]) for i in range(tiles[0]) for j in range(tiles[1])]
+
+
+class TiledEnvironment(ArrayEnvironment):
+    # tiles is the (columns, rows) grid the map is cut into, halo the width of the band of
+    # neighbouring food a tile searches first, workers the number of processes (one per
+    # core by default, never more than there are tiles; 1 runs the tiles in this process)
+    # call close(), or use it in a with block, to stop the workers and free the shared memory
+    def __init__(self, width, height, num_agents, num_food, tiles=(2, 2), halo=None, workers=None, seed=None, speed_boost=None, size_boost=None):
+        super().__init__(width, height, num_agents, num_food, seed, speed_boost, size_boost)
+        self.tiles = tiles
+        self.bounds = tile_bounds(width, height, tiles)
+        # a wider halo settles more agents within the tile, a narrower one sends more of
+        # them to the full search; the targets are the same either way
+        self.halo = 2 * self.start_speed if halo is None else halo
+        self.workers = min(workers or os.cpu_count() or 1, len(self.bounds))
+        if self.workers > 1:
+            # workers must report the blocks they open to this process's tracker; one they
+            # started themselves would unlink the blocks as leaked when they exit
+            resource_tracker.ensure_running()
+            self.pool = Pool(self.workers)
+        else:
+            self.pool = None
+        self.shared_agents = SharedColumns(AGENT_COLUMNS)
+        self.shared_food = SharedColumns(FOOD_COLUMNS)
+        # wall time of the movement phase, summed over generations
+        self.movement_seconds = 0.0
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        detach(())
+        self.shared_agents.close()
+        self.shared_food.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # the closest visible food for the agents in idx, looked up tile by tile
+    def nearest_food(self, idx, visible_until):
+        self.shared_agents.fill(len(self), {'pending': idx})
+        self.shared_food.fill(len(self.food_x), {'until': visible_until})
+        agent_spec = self.shared_agents.spec(len(self))
+        food_spec = self.shared_food.spec(len(self.food_x))
+        tasks = [(bounds, self.halo, self.width, self.height, len(idx), agent_spec, food_spec) for bounds in self.bounds]
+        run = self.pool.map if self.pool is not None else map
+        target = np.full(len(idx), -1, dtype=np.int64)
+        dist = np.full(len(idx), np.iinfo(np.int64).max, dtype=np.int64)
+        for mine, tile_target, tile_dist in run(tile_nearest, tasks):
+            target[mine] = tile_target
+            dist[mine] = tile_dist
+        return target, dist
+
+    # the movement phase, with agent positions and the food moved into shared memory
+    def movement(self):
+        started = time.perf_counter()
+        agents = self.shared_agents.fill(len(self), {'x': self.x, 'y': self.y})
+        self.shared_food.fill(len(self.food_x), {'x': self.food_x, 'y': self.food_y})
+        self.x, self.y = agents['x'], agents['y']
+        super().movement()
+        self.x, self.y = np.array(self.x), np.array(self.y)
+        self.movement_seconds += time.perf_counter() - started
+
+
+# SCALING ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# the same seeded run on every worker count in cores: movement-phase seconds, speedup
+# over the first entry and parallel efficiency (speedup per added worker), one line each
+def scaling(width, height, num_agents, num_food, generations=3, cores=(1, 2, 4), tiles=(4, 4), seed=2023):
+    report = []
+    for workers in cores:
+        with TiledEnvironment(width, height, num_agents, num_food, tiles=tiles, workers=workers, seed=seed) as env:
+            for _ in range(generations):
+                env.step()
+        if not report:
+            base_workers, base_seconds = workers, env.movement_seconds
+        speedup = base_seconds / env.movement_seconds
+        report.append({'workers': workers, 'seconds': env.movement_seconds, 'speedup': speedup, 'efficiency': speedup * base_workers / workers})
+        print('%2d workers: %.3fs movement, speedup %.2f, efficiency %.0f%%' % (workers, env.movement_seconds, speedup, 100 * report[-1]['efficiency']))
+    return report
+
+
+# DRIVER ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+def simulate(x, y, iterations, num_agents, num_food, tiles=(2, 2), workers=None, seed=None, speed_boost=None, size_boost=None, verbose=False, stop=None) :
+    with TiledEnvironment(x, y, num_agents, num_food, tiles, workers=workers, seed=seed, speed_boost=speed_boost, size_boost=size_boost) as env:
+        return run_simulation(env, iterations, verbose, stop=stop)
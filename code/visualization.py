@@ -0,0 +1,198 @@
+import os
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.animation as animation
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image, GifImagePlugin
+
+# REPLAY RENDERING ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Animations drawn from a TrajectoryRecorder after the run, instead of
+# stepping the simulation from inside the animation callback. Every frame
+# moves the existing artists (set_offsets / set_data) and is handed to the
+# writer straight away.
+#
+# every=k keeps every k-th tick (the last tick of a generation is always
+# kept), per_generation=True keeps only the last tick of each generation.
+
+
+# gif writer for machines without ffmpeg or imagemagick: every frame is reduced to its
+# own 256 colour palette and appended to the file as soon as it is grabbed, so only
+# the frame being drawn is held in memory (PillowWriter keeps them all until the end)
+class StreamingGifWriter(animation.AbstractMovieWriter):
+    def setup(self, fig, outfile, dpi=None):
+        super().setup(fig, outfile, dpi=dpi)
+        self.file = open(outfile, 'wb')
+        self.frames = 0
+
+    def grab_frame(self, **savefig_kwargs):
+        buf = BytesIO()
+        self.fig.savefig(buf, **{**savefig_kwargs, 'format': 'rgba', 'dpi': self.dpi})
+        frame = Image.frombuffer('RGBA', self.frame_size, buf.getbuffer(), 'raw', 'RGBA', 0, 1)
+        frame = frame.convert('RGB').convert('P', palette=Image.Palette.ADAPTIVE)
+        duration = int(1000 / self.fps)
+        if self.frames == 0:
+            # the first frame's palette is the global one, later frames bring their own
+            header, _ = GifImagePlugin.getheader(frame, info={'loop': 0, 'duration': duration})
+            self.file.write(b''.join(header))
+            data = GifImagePlugin.getdata(frame, duration=duration)
+        else:
+            data = GifImagePlugin.getdata(frame, duration=duration, include_color_table=True)
+        self.file.write(b''.join(data))
+        self.frames += 1
+
+    def finish(self):
+        self.file.write(b';')
+        self.file.close()
+
+
+# ffmpeg and imagemagick are fed each frame through a pipe as it is drawn, without
+# them every frame is encoded by Pillow as it comes
+def gif_writer(fps):
+    for name in ('ffmpeg', 'imagemagick'):
+        if animation.writers.is_available(name):
+            return animation.writers[name](fps=fps)
+    return StreamingGifWriter(fps=fps)
+
+
+# yields (generation, tick, xs, ys) with the position of every agent seen so far
+# in that generation, agents keep their last recorded position
+def replay_frames(recorder, every=1, per_generation=False):
+    samples = recorder.samples()
+    samples = samples[np.lexsort((samples['tick'], samples['generation']))]
+    generations = samples['generation']
+    starts = np.flatnonzero(np.r_[True, generations[1:] != generations[:-1]])
+    ends = np.r_[starts[1:], len(samples)].astype(int)
+    for start, end in zip(starts, ends):
+        chunk = samples[start:end]
+        uids, slot = np.unique(chunk['agent'], return_inverse=True)
+        xs = np.zeros(len(uids), dtype=chunk['x'].dtype)
+        ys = np.zeros(len(uids), dtype=chunk['y'].dtype)
+        seen = np.zeros(len(uids), dtype=bool)
+        ticks = chunk['tick']
+        bounds = np.flatnonzero(np.r_[True, ticks[1:] != ticks[:-1], True])
+        last = len(bounds) - 2
+        for k in range(len(bounds) - 1):
+            a, b = bounds[k], bounds[k + 1]
+            xs[slot[a:b]] = chunk['x'][a:b]
+            ys[slot[a:b]] = chunk['y'][a:b]
+            seen[slot[a:b]] = True
+            tick = int(ticks[a])
+            if k != last and (per_generation or tick % every):
+                continue
+            yield int(generations[start]), tick, xs[seen], ys[seen]
+
+
+# gif of a whole recorded run: agents and the food laid out for their generation on
+# top, population underneath when agent_counts (one entry per generation, as in
+# Environment.agent_counts) is given
+def render_run(recorder, path, agent_counts=None, every=1, per_generation=False, fps=10, dpi=100):
+    if agent_counts is not None:
+        fig, (ax1, ax2) = plt.subplots(2, 1)
+        fig.set_figheight(8)
+        # ax2 for number of agents over time (generations)
+        ax2.set_title('Number of Agents')
+        ax2.set_xlabel('Generations')
+        ax2.set_ylabel('Number of Agents')
+        ax2.set_xlim(0, max(len(agent_counts) - 1, 1))
+        ax2.set_ylim(0, max(agent_counts) * 1.1 + 1)
+        line_agents, = ax2.plot([], [], c='k')
+    else:
+        fig, ax1 = plt.subplots()
+    fig.set_figwidth(5)
+
+    # ax1 for agents and food locations in scatter plot
+    ax1.set_xlim(0, recorder.width)
+    ax1.set_ylim(0, recorder.height)
+    ax1.set_xlabel('X')
+    ax1.set_ylabel('Y')
+    scat_food = ax1.scatter([], [], c='r', s=30, marker='x', label='Food')
+    scat_agents = ax1.scatter([], [], c='k', s=30, marker='*', label='Agent')
+    ax1.legend(loc='lower center', bbox_to_anchor=(0.5, -0.3), ncol=2)
+    fig.tight_layout()
+    plt.subplots_adjust(wspace=0, hspace=0.4)
+
+    food = recorder.food()
+    shown = None
+    writer = gif_writer(fps)
+    with writer.saving(fig, path, dpi):
+        for generation, tick, xs, ys in replay_frames(recorder, every, per_generation):
+            if generation != shown:
+                here = food[food['generation'] == generation]
+                scat_food.set_offsets(np.c_[here['x'], here['y']])
+                if agent_counts is not None:
+                    line_agents.set_data(range(generation + 1), agent_counts[:generation + 1])
+                shown = generation
+            scat_agents.set_offsets(np.c_[xs, ys])
+            ax1.set_title('Generation #%i, time step %i (%i agents)' % (generation, tick, len(xs)))
+            writer.grab_frame()
+    plt.close(fig)
+
+
+# gif of one agent's path, drawn on fig (a new one if None) and left open for reuse
+def render_path(xs, ys, width, height, path, every=1, fps=10, dpi=100, fig=None):
+    fig = fig or plt.figure()
+    fig.clf()
+    ax = fig.gca()
+    ax.set_xlim(0, width)
+    ax.set_ylim(0, height)
+    line, = ax.plot([], [])
+    frames = list(range(1, len(xs) + 1, every))
+    if frames and frames[-1] != len(xs):
+        frames.append(len(xs))
+    writer = gif_writer(fps)
+    with writer.saving(fig, path, dpi):
+        for frame_number in frames:
+            line.set_data(xs[:frame_number], ys[:frame_number])
+            ax.set_title(f"Time Step: {frame_number}")
+            writer.grab_frame()
+    return fig
+
+
+# uids of the recorded agents to draw: the `top` longest-lived (most recorded time
+# steps, ties to the lower uid), or a random `sample` of them, or all of them
+def select_agents(recorder, sample=None, top=None, seed=None):
+    uids, lifetimes = np.unique(recorder.samples()['agent'], return_counts=True)
+    if top is not None:
+        uids = uids[np.lexsort((uids, -lifetimes))[:top]]
+    elif sample is not None and sample < len(uids):
+        uids = np.sort(np.random.default_rng(seed).choice(uids, sample, replace=False))
+    return uids.tolist()
+
+
+# runs in the worker process: its own Agg canvas, closed when the batch is done
+def render_batch(batch, width, height, directory, every, fps, dpi):
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    for uid, xs, ys in batch:
+        render_path(xs, ys, width, height, os.path.join(directory, f'animation_agent_#{uid}.gif'), every, fps, dpi, fig)
+    fig.clf()
+    return len(batch)
+
+
+# animation_agent_#<uid>.gif in directory for every recorded agent, or for uids, or for
+# the agents picked by select_agents(sample=..., top=...)
+# workers > 1 spreads the agents over a process pool in batches of batch_size;
+# progress prints how many are done as batches finish
+def render_agents(recorder, directory, uids=None, every=1, fps=10, dpi=100, workers=1, sample=None, top=None, seed=None, batch_size=8, progress=False):
+    os.makedirs(directory, exist_ok=True)
+    if uids is None and (sample is not None or top is not None):
+        uids = select_agents(recorder, sample, top, seed)
+    paths = list(recorder.trajectories(uids))
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    done = 0
+    if workers == 1:
+        for batch in batches:
+            done += render_batch(batch, recorder.width, recorder.height, directory, every, fps, dpi)
+            if progress:
+                print('rendered %d/%d agents' % (done, len(paths)))
+        return done
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(render_batch, batch, recorder.width, recorder.height, directory, every, fps, dpi) for batch in batches]
+        for future in as_completed(futures):
+            done += future.result()
+            if progress:
+                print('rendered %d/%d agents' % (done, len(paths)))
+    return done